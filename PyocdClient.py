@@ -8,57 +8,316 @@ __author__ = "george"
 __date__ = "2024/09/23 20:20"
 __version__ = "1.0.0"
 
+import time
+_startup_t0 = time.perf_counter()
+_import_times = {}
+
 import os
 from configparser import ConfigParser
 import logging
-import time
+_t = time.perf_counter()
 import dearpygui.dearpygui as dpg
+_import_times["dearpygui"] = time.perf_counter() - _t
 import ctypes
 import platform
 import os
 import sys
+import importlib
+import importlib.util
 from time import sleep
-from pyocd.core.helpers import ConnectHelper
-from pyocd.tools.lists import ListGenerator
-import colorama
-import prettytable
-from typing import (Any, Dict, List, Optional, Type,Iterable,Tuple,Sequence)
-
-from pyocd.core.session import Session
-from pyocd.target.pack import pack_target
-from pyocd.flash.eraser import FlashEraser
+from typing import (Any, Dict, List, Optional, Type,Iterable,Tuple,Sequence,Set)
 from pathlib import Path
-from pyocd.flash.file_programmer import FileProgrammer
-
-from pyocd.core.soc_target import SoCTarget
-from pyocd.debug.rtt import RTTControlBlock, RTTUpChannel, RTTDownChannel
-from pyocd.subcommands.base import SubcommandBase
-from pyocd.utility.cmdline import convert_session_options, int_base_0
-from pyocd.utility.kbhit import KBHit
 import threading
-from pyocd.probe.aggregator import PROBE_CLASSES
-from pyocd.probe.cmsis_dap_probe import CMSISDAPProbe
-PROBE_CLASSES["cmsisdap"] = CMSISDAPProbe
+import collections
+import queue
+import hashlib
+import json
+import zlib
+import gzip
+from contextlib import contextmanager
+import codecs
+import re
+import itertools
+import mmap
+from array import array
+import argparse
+import atexit
+import io
+import concurrent.futures
+import shlex
+import bisect
+import struct
+import tempfile
+import tracemalloc
+try:
+    import resource
+except ImportError:     # not available on Windows
+    resource = None
 
 #from pyocd.utility.progress import (print_progress)
 
 LOG = logging.getLogger(__name__)
 DEFAULT_LOG_LEVEL = logging.WARNING
 
+#延迟导入
+class _LazyImport:
+    """@brief Stand-in for a module, or a name from a module, that is imported on first use.
+
+    pyOCD and the console helpers take seconds to import, so they are only loaded when an
+    operation actually needs them. The import time is recorded for the startup report.
+    """
+    def __init__(self, module: str, name: str = None):
+        self.__dict__["_module"] = module
+        self.__dict__["_name"] = name
+        self.__dict__["_value"] = None
+
+    def _resolve(self):
+        value = self.__dict__["_value"]
+        if value is None:
+            module = self.__dict__["_module"]
+            name = self.__dict__["_name"]
+            if module.startswith("pyocd"):
+                _init_pyocd()
+            start = time.perf_counter()
+            value = importlib.import_module(module)
+            if name is not None:
+                value = getattr(value, name)
+            _import_times[module] = _import_times.get(module, 0.0) + time.perf_counter() - start
+            self.__dict__["_value"] = value
+        return value
+
+    # module dunders that are plain data; any other dunder is refused, because typing and copy
+    # probe those on annotations and that must not trigger the import
+    FORWARDED_DUNDERS = ("__version__", "__file__", "__all__")
+
+    def __getattr__(self, attr):
+        if attr.startswith("__") and attr not in _LazyImport.FORWARDED_DUNDERS:
+            raise AttributeError(attr)
+        return getattr(self._resolve(), attr)
+
+    def __call__(self, *args, **kwargs):
+        return self._resolve()(*args, **kwargs)
+
+    def __repr__(self):
+        return "<lazy %s%s>" % (self.__dict__["_module"], ":" + self.__dict__["_name"] if self.__dict__["_name"] else "")
+
+_pyocd_ready = False
+
+def _init_pyocd() -> None:
+    """@brief One-time pyOCD setup, run just before the first pyOCD import."""
+    global _pyocd_ready
+    if _pyocd_ready:
+        return
+    start = time.perf_counter()
+    from pyocd.probe.aggregator import PROBE_CLASSES
+    from pyocd.probe.cmsis_dap_probe import CMSISDAPProbe
+    PROBE_CLASSES["cmsisdap"] = CMSISDAPProbe
+    _pyocd_ready = True
+    _import_times["pyocd.probe"] = time.perf_counter() - start
+
+ConnectHelper = _LazyImport("pyocd.core.helpers", "ConnectHelper")
+ListGenerator = _LazyImport("pyocd.tools.lists", "ListGenerator")
+colorama = _LazyImport("colorama")
+prettytable = _LazyImport("prettytable")
+Session = _LazyImport("pyocd.core.session", "Session")
+pack_target = _LazyImport("pyocd.target.pack.pack_target")
+CmsisPack = _LazyImport("pyocd.target.pack.cmsis_pack", "CmsisPack")
+pyocd = _LazyImport("pyocd")
+FlashEraser = _LazyImport("pyocd.flash.eraser", "FlashEraser")
+FileProgrammer = _LazyImport("pyocd.flash.file_programmer", "FileProgrammer")
+FlashLoader = _LazyImport("pyocd.flash.loader", "FlashLoader")
+SoCTarget = _LazyImport("pyocd.core.soc_target", "SoCTarget")
+MemoryType = _LazyImport("pyocd.core.memory_map", "MemoryType")
+RTTControlBlock = _LazyImport("pyocd.debug.rtt", "RTTControlBlock")
+RTTUpChannel = _LazyImport("pyocd.debug.rtt", "RTTUpChannel")
+RTTDownChannel = _LazyImport("pyocd.debug.rtt", "RTTDownChannel")
+KBHit = _LazyImport("pyocd.utility.kbhit", "KBHit")
+normalise_target_type_name = _LazyImport("pyocd.target", "normalise_target_type_name")
+
+
+#启动计时
+class StartupTimer:
+    """@brief Per-import and per-phase startup timing.
+
+    The report is printed once the first frames are on screen and appended as one JSON line to
+    cache/startup/timing.jsonl so startup regressions can be tracked across versions.
+    """
+    def __init__(self, t0: float):
+        self.t0 = t0
+        self.phases: List[Tuple[str, float]] = [("imports", time.perf_counter() - t0)]
+        self.reported = False
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+
+    def report(self) -> None:
+        if self.reported:
+            return
+        self.reported = True
+        total = time.perf_counter() - self.t0
+        print("startup %.3fs" % total)
+        for name, seconds in self.phases:
+            print("  phase  %-20s %.3fs" % (name, seconds))
+        for name, seconds in sorted(_import_times.items(), key=lambda i: -i[1]):
+            print("  import %-20s %.3fs" % (name, seconds))
+        record = {"time": time.strftime("%Y-%m-%d %H:%M:%S"), "version": __version__, "total": round(total, 4),
+                  "phases": {name: round(seconds, 4) for name, seconds in self.phases},
+                  "imports": {name: round(seconds, 4) for name, seconds in _import_times.items()}}
+        try:
+            with open(os.path.join(cache_dir("startup"), "timing.jsonl"), 'a', encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+        except OSError as e:
+            LOG.warning("Writing startup timing failed: %s", e)
+
 #配置文件
 file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.ini")
-cf = ConfigParser()
-cf.read('config.ini', encoding='utf-8')
 
-def save_config(key,value):
-    cf.read('config.ini', encoding='utf-8')
-    if not cf.has_section('pyocd'):
-        cf.add_section('pyocd')
-    cf.set('pyocd', key, value)
-    cf.write(open(file_path, 'w+'))
-def read_config(key)->str:
-    #cf.read('config.ini', encoding='utf-8')
-    return cf.get('pyocd', key,fallback="")
+class ConfigStore:
+    """@brief config.ini held in memory and written behind, debounced and atomically.
+
+    set() only changes the in-memory ConfigParser. A writer thread saves the file once no change
+    has come in for @a delay seconds, so typing into a tracked input costs no disk I/O. The file is
+    written to a temporary file next to it, synced and renamed over the old one, so a crash leaves
+    either the old or the new file, never a truncated one.
+    """
+    def __init__(self, path: str, delay: float = 1.0):
+        self.path = path
+        self.delay = delay
+        self.parser = ConfigParser(interpolation=None)
+        self.parser.read(path, encoding='utf-8')
+        self.version = 0
+        self.saved_version = 0
+        self.writes = 0
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._changed = threading.Event()
+        self._thread = None
+
+    def get(self, key: str, section: str = 'pyocd') -> str:
+        return self.parser.get(section, key, fallback="")
+
+    def set(self, key: str, value: str, section: str = 'pyocd') -> None:
+        with self._lock:
+            if self.parser.has_option(section, key) and self.parser.get(section, key) == value:
+                return
+            if not self.parser.has_section(section):
+                self.parser.add_section(section)
+            self.parser.set(section, key, value)
+            self.version += 1
+        self._schedule()
+
+    def sections(self) -> List[str]:
+        return self.parser.sections()
+
+    def remove_section(self, section: str) -> None:
+        with self._lock:
+            if not self.parser.remove_section(section):
+                return
+            self.version += 1
+        self._schedule()
+
+    def _schedule(self) -> None:
+        self._changed.set()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="config-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self._changed.wait()
+            self._changed.clear()
+            # debounce: wait until nothing has changed for a whole delay
+            while self._changed.wait(self.delay):
+                self._changed.clear()
+            try:
+                self.flush()
+            except OSError as e:
+                LOG.warning("Saving %s failed: %s", self.path, e)
+
+    def flush(self) -> None:
+        """@brief Write pending changes now; called by the writer thread and at exit."""
+        with self._write_lock:
+            with self._lock:
+                version = self.version
+                if version == self.saved_version:
+                    return
+                text = io.StringIO()
+                self.parser.write(text)
+            directory = os.path.dirname(self.path)
+            fd, temp = tempfile.mkstemp(prefix=".config.", suffix=".tmp", dir=directory)
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    f.write(text.getvalue())
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp, self.path)
+            except BaseException:
+                if os.path.exists(temp):
+                    os.remove(temp)
+                raise
+            self.saved_version = version
+            self.writes += 1
+
+configStore = ConfigStore(file_path)
+atexit.register(configStore.flush)
+
+def save_config(key,value,section='pyocd'):
+    configStore.set(key, value, section)
+def read_config(key,section='pyocd')->str:
+    return configStore.get(key, section)
+def read_config_int(key, default: int) -> int:
+    value = read_config(key)
+    try:
+        return int(value, base=0) if value else default
+    except ValueError:
+        LOG.warning("invalid integer '%s' for config key '%s'", value, key)
+        return default
+#配置方案
+# settings that make up one fixture/target setup
+PROFILE_KEYS = ("pack_path", "target_name", "bin_path", "swd_frequency", "delta_flash", "flash_verify")
+PROFILE_PREFIX = "profile:"
+
+def profile_names() -> List[str]:
+    return [section[len(PROFILE_PREFIX):] for section in configStore.sections() if section.startswith(PROFILE_PREFIX)]
+
+def save_profile(name: str) -> None:
+    """@brief Store the current values of PROFILE_KEYS as profile @a name."""
+    for key in PROFILE_KEYS:
+        save_config(key, read_config(key), section=PROFILE_PREFIX + name)
+    save_config("profile", name)
+
+def load_profile(name: str) -> bool:
+    """@brief Make profile @a name's values the current settings; False if there is no such profile."""
+    section = PROFILE_PREFIX + name
+    if section not in configStore.sections():
+        return False
+    for key in PROFILE_KEYS:
+        save_config(key, read_config(key, section=section))
+    save_config("profile", name)
+    return True
+
+def delete_profile(name: str) -> None:
+    configStore.remove_section(PROFILE_PREFIX + name)
+    if read_config("profile") == name:
+        save_config("profile", "")
+
+def read_config_float(key, default: float) -> float:
+    value = read_config(key)
+    try:
+        return float(value) if value else default
+    except ValueError:
+        LOG.warning("invalid number '%s' for config key '%s'", value, key)
+        return default
+def cache_dir(name: str) -> str:
+    """@brief Directory for one kind of cached data, created on first use."""
+    path = os.path.join(read_config("cache_dir") or os.path.join(os.path.dirname(file_path), "cache"), name)
+    os.makedirs(path, exist_ok=True)
+    return path
 
 
 #UI界面
@@ -142,7 +401,7 @@ def get_probe_list(probes: Sequence["DebugProbe"]) -> None:
         #         ])
     
 
-def _get_pretty_table( fields: List[str], header: bool = None) -> prettytable.PrettyTable:
+def _get_pretty_table( fields: List[str], header: bool = None) -> "prettytable.PrettyTable":
         """@brief Returns a PrettyTable object with formatting options set."""
         pt = prettytable.PrettyTable(fields)
         pt.align = 'l'
@@ -297,14 +556,1361 @@ def erase_targets():
         #addresses = flatten_args(self._args.addresses)
         eraser.erase(None)
 
+#会话管理
+class SessionManager:
+    """@brief Keeps one open pyOCD session and reuses it for erase, program and RTT.
+
+    The session is keyed by probe unique ID, pack and target. Asking for a different key, or a
+    failed health check (a CPUID read), closes it and opens a new one. Flash jobs hold @a lock
+    for the whole operation while the RTT loop takes it once per poll pass, so the two can share
+    the session without interleaving SWD transfers.
+    """
+    HEALTH_CHECK_ADDRESS = 0xE000ED00   # SCB CPUID, readable on every Cortex-M
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.session: Optional[Session] = None
+        self.key = None
+        self.connect_time = 0.0
+        self.uses = 0
+        self.resets = 0             # bumped by note_reset(), tells the RTT loop to re-attach
+        self._stale = False
+        self._closing = False
+
+    def _open(self, key) -> Session:
+        unique_id, pack_path, target_name, frequency = key
+        start = time.perf_counter()
+        session = ConnectHelper.session_with_chosen_probe(
+                            project_dir=None,
+                            config_file=None,
+                            user_script=None,
+                            no_config=None,
+                            pack=pack_path, 
+                            unique_id=unique_id,
+                            blocking=(not None),
+                            connect_mode=None,
+                            options = {"frequency": frequency, "target_override": target_name},
+                            option_defaults=None,
+                            )
+        if session is None:
+            raise RuntimeError("No target device available")
+        session.open()
+        self.connect_time = time.perf_counter() - start
+        perfCounters.record_phase("connect", self.connect_time)
+        LOG.info("Session to %s opened in %.2fs", session.probe.unique_id, self.connect_time)
+        return session
+
+    def healthy(self) -> bool:
+        session = self.session
+        if session is None or not session.is_open:
+            return False
+        try:
+            session.board.target.read32(self.HEALTH_CHECK_ADDRESS)
+            return True
+        except Exception as e:
+            LOG.warning("Session health check failed: %s", e)
+            return False
+
+    def get(self, unique_id: Optional[str], pack_path: Optional[str], target_name: Optional[str]) -> Session:
+        """@brief Return an open session for the given selection, reusing the current one if possible."""
+        key = (unique_id, pack_path, target_name, session_frequency(unique_id, target_name))
+        with self.lock:
+            if self.session is not None and (self._stale or key != self.key or not self.healthy()):
+                self.close()
+            if self.session is None:
+                self.session = self._open(key)
+                self.key = key
+                self._stale = False
+            self.uses += 1
+            return self.session
+
+    @contextmanager
+    def acquire(self, unique_id: Optional[str], pack_path: Optional[str], target_name: Optional[str]):
+        """@brief Hold the session exclusively for the duration of the with block."""
+        with self.lock:
+            yield self.get(unique_id, pack_path, target_name)
+
+    def close(self) -> None:
+        with self.lock:
+            if self.session is not None:
+                try:
+                    self.session.close()
+                except Exception as e:
+                    LOG.warning("Closing session failed: %s", e)
+            self.session = None
+            self.key = None
+
+    def note_reset(self) -> None:
+        """@brief Record that the target was reset, so RTT looks for its control block again."""
+        self.resets += 1
+
+    def invalidate(self) -> None:
+        """@brief Drop the session after a selection change.
+
+        Never blocks the caller, which is usually a widget callback: the session is marked stale so
+        get() will not reuse it, and closed on a background thread once no job holds it. Repeated
+        calls, e.g. one per keystroke, share one pending close.
+        """
+        self._stale = True
+        if self.session is not None and not self._closing:
+            self._closing = True
+            threading.Thread(target=self._close_stale, name="session-close", daemon=True).start()
+
+    def _close_stale(self) -> None:
+        with self.lock:
+            self._closing = False
+            # a get() in the meantime may already have replaced the stale session
+            if self._stale:
+                self.close()
+
+    def status(self) -> str:
+        if self.session is None or self.key is None:
+            return "未连接"
+        unique_id, pack_path, target_name, frequency = self.key
+        return "已连接 %s %s @%s (%.2fs, %d uses)" % (self.session.probe.unique_id, target_name or "",
+                                                  frequency_label(frequency), self.connect_time, self.uses)
+
+sessionManager = SessionManager()
+
+def session_disconnect_callback(sender, app_data):
+    rttThread.DisConnect()
+    sessionManager.invalidate()
+
+def update_session_status() -> None:
+    if dpg.does_item_exist("session_status"):
+        dpg.set_value("session_status", sessionManager.status())
+
 def print_progress(progress):
     print(progress)
-    dpg.set_value("flash_progress_bar", progress)
+    perfCounters.flash_progress(progress)
+    ui_call(dpg.set_value, "flash_progress_bar", progress)
+
+#RTT日志缓存
+class RTTLogBuffer:
+    """@brief Bounded, line-indexed ring buffer holding the RTT log.
+
+    Lines are stored without their trailing newline. Every line gets an absolute sequence number
+    that keeps counting up across evictions, so a view can address lines by number while old ones
+    drop off the front. The trailing incomplete line is kept apart, as a list of pieces, until its
+    newline arrives; a line longer than @a max_line characters is cut into several, so a channel
+    that never sends a newline still stays within @a max_bytes.
+    """
+    def __init__(self, max_lines: int = 20000, max_bytes: int = 4 * 1024 * 1024, max_line: int = 4096):
+        self.max_lines = max(1, max_lines)
+        self.max_bytes = max(1, max_bytes)
+        self.max_line = max(1, min(max_line, self.max_bytes))
+        self.lock = threading.Lock()
+        self._lines: collections.deque = collections.deque()
+        self._sizes: collections.deque = collections.deque()
+        self._partial: List[str] = []
+        self._partial_chars = 0
+        self._partial_bytes = 0
+        self._bytes = 0
+        self.first_seq = 0      # sequence number of self._lines[0]
+        self.version = 0        # bumped on every change, lets views skip redundant redraws
+
+    @property
+    def end_seq(self) -> int:
+        """@brief Sequence number one past the last complete line."""
+        return self.first_seq + len(self._lines)
+
+    def __len__(self) -> int:
+        return len(self._lines) + (1 if self._partial else 0)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes + self._partial_bytes
+
+    def _add_line(self, line: str, completed: List[str]) -> None:
+        for start in range(0, max(len(line), 1), self.max_line):
+            piece = line[start:start + self.max_line]
+            size = len(piece.encode("utf-8")) + 1
+            self._lines.append(piece)
+            self._sizes.append(size)
+            self._bytes += size
+            completed.append(piece)
+
+    def _add_partial(self, text: str, completed: List[str]) -> None:
+        if not text:
+            return
+        self._partial.append(text)
+        self._partial_chars += len(text)
+        self._partial_bytes += len(text.encode("utf-8"))
+        if self._partial_chars > self.max_line:
+            # joined only once per max_line characters, so a long line costs linear time; the
+            # remainder is never empty, so a newline right at the limit does not add a blank line
+            joined = ''.join(self._partial)
+            cut = (len(joined) - 1) // self.max_line * self.max_line
+            self._add_line(joined[:cut], completed)
+            rest = joined[cut:]
+            self._partial = [rest] if rest else []
+            self._partial_chars = len(rest)
+            self._partial_bytes = len(rest.encode("utf-8"))
+
+    def append(self, text: str) -> Tuple[int, List[str]]:
+        """@brief Add decoded RTT text, splitting it into lines and evicting the oldest ones.
+
+        @return Bi-tuple of the sequence number of the first line completed by this call and the
+            completed lines, for indexing.
+        """
+        if not text:
+            return self.end_seq, []
+        with self.lock:
+            start_seq = self.end_seq
+            completed: List[str] = []
+            parts = text.split('\n')
+            if len(parts) > 1:
+                self._partial.append(parts[0])
+                line = ''.join(self._partial)
+                self._partial, self._partial_chars, self._partial_bytes = [], 0, 0
+                self._add_line(line, completed)
+                for line in parts[1:-1]:
+                    self._add_line(line, completed)
+            self._add_partial(parts[-1], completed)
+            self._evict()
+            self.version += 1
+            return start_seq, completed
+
+    def _evict(self) -> None:
+        while self._lines and (len(self._lines) > self.max_lines or
+                               self._bytes + self._partial_bytes > self.max_bytes):
+            self._lines.popleft()
+            self._bytes -= self._sizes.popleft()
+            self.first_seq += 1
+
+    def clear(self) -> None:
+        with self.lock:
+            self.first_seq = self.end_seq
+            self._lines.clear()
+            self._sizes.clear()
+            self._partial, self._partial_chars, self._partial_bytes = [], 0, 0
+            self._bytes = 0
+            self.version += 1
+
+    def get_lines(self, start_seq: int, count: int) -> List[str]:
+        """@brief Return up to @a count lines starting at sequence number @a start_seq.
+
+        The incomplete trailing line is included when the window reaches the end of the buffer.
+        """
+        with self.lock:
+            start = max(start_seq, self.first_seq) - self.first_seq
+            stop = min(start + count, len(self._lines))
+            lines = [self._lines[i] for i in range(start, stop)] if start < stop else []
+            if self._partial and stop == len(self._lines) and len(lines) < count:
+                lines.append(''.join(self._partial))
+            return lines
+
+    def get_window(self, start_seq: int, count: int) -> str:
+        return '\n'.join(self.get_lines(start_seq, count))
+
+    def lines_for(self, seqs: Iterable[int]) -> List[str]:
+        """@brief Look up individual lines by sequence number, skipping evicted ones."""
+        with self.lock:
+            first = self.first_seq
+            end = self.end_seq
+            return [self._lines[seq - first] for seq in seqs if first <= seq < end]
+
+    def snapshot(self) -> Tuple[int, List[str]]:
+        """@brief Copy of the complete lines with the sequence number of the first one."""
+        with self.lock:
+            return self.first_seq, list(self._lines)
+
+    def tail(self, count: int) -> str:
+        """@brief Text of the last @a count lines, which is what the log widget shows while following."""
+        with self.lock:
+            n = count - (1 if self._partial else 0)
+            start = max(self.first_seq, self.end_seq - max(n, 0))
+        return self.get_window(start, count)
+
+
+#RTT日志检索
+LOG_LEVELS = ("TRACE", "DEBUG", "INFO", "WARN", "ERROR", "FATAL")
+_LEVEL_ALIASES = {"V": "TRACE", "T": "TRACE", "D": "DEBUG", "I": "INFO", "W": "WARN", "WARNING": "WARN",
+                  "E": "ERROR", "F": "FATAL", "CRITICAL": "FATAL"}
+
+class RTTLogIndex:
+    """@brief Incrementally maintained search index over one RTTLogBuffer.
+
+    Every line is classified once as it arrives: its level (ERROR, "[E]", "E/" ...) and first
+    bracketed tag go into per-level and per-tag sequence lists. The active filter's matches are
+    kept up to date by testing only new lines. Changing the filter narrows the candidates through
+    the level/tag lists, and a substring that extends the previous one only rescans the previous
+    matches, so typing does not rescan the whole history.
+    """
+    LEVEL_WORD_RE = re.compile(r'\b(TRACE|DEBUG|INFO|WARN(?:ING)?|ERROR|FATAL|CRITICAL)\b', re.IGNORECASE)
+    LEVEL_LETTER_RE = re.compile(r'^\s*(?:\[([VTDIWEF])\]|([VTDIWEF])[/:])')
+    TAG_RE = re.compile(r'\[([A-Za-z_][\w.\-]{0,31})\]')
+
+    def __init__(self, buffer: RTTLogBuffer):
+        self.buffer = buffer
+        self.levels: Dict[str, collections.deque] = {}
+        self.tags: Dict[str, collections.deque] = {}
+        self.tags_version = 0
+        self.query = ''
+        self.regex = False
+        self.level = ''
+        self.tag = ''
+        self.error = ''
+        self._pattern = None
+        self.matches: collections.deque = collections.deque()
+        self.version = 0
+
+    @property
+    def active(self) -> bool:
+        return bool(self.query or self.level or self.tag)
+
+    @classmethod
+    def classify(cls, line: str) -> Tuple[str, str]:
+        level = ''
+        m = cls.LEVEL_LETTER_RE.match(line)
+        if m:
+            level = _LEVEL_ALIASES[m.group(1) or m.group(2)]
+        else:
+            m = cls.LEVEL_WORD_RE.search(line)
+            if m:
+                word = m.group(1).upper()
+                level = _LEVEL_ALIASES.get(word, word)
+        tag = ''
+        for m in cls.TAG_RE.finditer(line):
+            name = m.group(1)
+            if name.upper() not in _LEVEL_ALIASES and name.upper() not in LOG_LEVELS:
+                tag = name
+                break
+        return level, tag
+
+    def reset(self) -> None:
+        self.levels.clear()
+        self.tags.clear()
+        self.tags_version += 1
+        self.matches.clear()
+        self.version += 1
+
+    def add_lines(self, start_seq: int, lines: List[str]) -> None:
+        """@brief Index lines just appended to the buffer, @a start_seq being the first one's number."""
+        matched = False
+        for seq, line in enumerate(lines, start_seq):
+            level, tag = self.classify(line)
+            if level:
+                self.levels.setdefault(level, collections.deque()).append(seq)
+            if tag:
+                if tag not in self.tags:
+                    self.tags[tag] = collections.deque()
+                    self.tags_version += 1
+                self.tags[tag].append(seq)
+            if self.active and self._match(line, level, tag):
+                self.matches.append(seq)
+                matched = True
+        self._prune()
+        if matched:
+            self.version += 1
+
+    def _prune(self) -> None:
+        first = self.buffer.first_seq
+        for seqs in (self.matches, *self.levels.values(), *self.tags.values()):
+            while seqs and seqs[0] < first:
+                seqs.popleft()
+
+    def _match_text(self, line: str) -> bool:
+        if not self.query:
+            return True
+        if self._pattern is not None:
+            return self._pattern.search(line) is not None
+        return self.query in line
+
+    def _match(self, line: str, level: str, tag: str) -> bool:
+        if self.level and level != self.level:
+            return False
+        if self.tag and tag != self.tag:
+            return False
+        return self._match_text(line)
+
+    def set_filter(self, query: str, regex: bool = False, level: str = '', tag: str = '') -> None:
+        refine = (self.active and not regex and not self.regex and self.query and self.query in query
+                  and level == self.level and tag == self.tag and not self.error)
+        self.query, self.regex, self.level, self.tag = query, regex, level, tag
+        self.error = ''
+        self._pattern = None
+        self.version += 1
+        if regex and query:
+            try:
+                self._pattern = re.compile(query)
+            except re.error as e:
+                self.error = str(e)
+                self.matches = collections.deque()
+                return
+        if not self.active:
+            self.matches = collections.deque()
+            return
+
+        self._prune()
+        first, lines = self.buffer.snapshot()
+        if refine:
+            candidates = self.matches
+        elif level and tag:
+            tagged = set(self.tags.get(tag, ()))
+            candidates = [seq for seq in self.levels.get(level, ()) if seq in tagged]
+        elif level:
+            candidates = self.levels.get(level, ())
+        elif tag:
+            candidates = self.tags.get(tag, ())
+        else:
+            candidates = range(first, first + len(lines))
+        # every indexed seq is >= first after pruning; plain loops keep the scan in C where possible
+        query = self.query
+        if not query:
+            hits = candidates
+        elif self._pattern is not None:
+            search = self._pattern.search
+            hits = [seq for seq in candidates if search(lines[seq - first])]
+        elif isinstance(candidates, range):
+            hits = [seq for seq, line in zip(candidates, lines) if query in line]
+        else:
+            hits = [seq for seq in candidates if query in lines[seq - first]]
+        self.matches = collections.deque(hits)
+
+
+class RTTLogView:
+    """@brief Binds an RTTLogBuffer to a read-only multiline widget.
+
+    Only the visible window (the last @a view_lines lines while following, otherwise the lines
+    selected with the scroll slider) is handed to Dear PyGui. While the index has an active filter
+    the window moves over the matching lines instead.
+    """
+    def __init__(self, buffer: RTTLogBuffer, text_tag: str, scroll_tag: str = None,
+                 follow_tag: str = None, view_lines: int = 200, index: RTTLogIndex = None):
+        self.buffer = buffer
+        self.index = index
+        self.text_tag = text_tag
+        self.scroll_tag = scroll_tag
+        self.follow_tag = follow_tag
+        self.view_lines = max(1, view_lines)
+        self._shown = None
+
+    def following(self) -> bool:
+        if self.follow_tag is None or not dpg.does_item_exist(self.follow_tag):
+            return True
+        return bool(dpg.get_value(self.follow_tag))
+
+    def refresh(self, force: bool = False) -> None:
+        buf = self.buffer
+        index = self.index
+        filtered = index is not None and index.active
+        pos = None if self.following() else dpg.get_value(self.scroll_tag)
+        key = (buf.version, index.version if filtered else None, pos)
+        if key == self._shown and not force:
+            return
+        self._shown = key
+        if filtered:
+            first, end = 0, len(index.matches)
+        else:
+            first, end = buf.first_seq, buf.end_seq
+        last = max(first, end - self.view_lines)
+        if self.scroll_tag is not None and dpg.does_item_exist(self.scroll_tag):
+            dpg.configure_item(self.scroll_tag, min_value=first, max_value=last)
+            if pos is None:
+                dpg.set_value(self.scroll_tag, last)
+        if filtered:
+            start = last if pos is None else min(max(pos, first), last)
+            seqs = itertools.islice(index.matches, start, start + self.view_lines)
+            text = '\n'.join(buf.lines_for(seqs))
+        elif pos is None:
+            text = buf.tail(self.view_lines)
+        else:
+            text = buf.get_window(pos, self.view_lines)
+        dpg.set_value(self.text_tag, text)
+
+
+class RTTStats:
+    """@brief Throughput counters for the RTT capture/render pipeline.
+
+    The capture side and the render side each only touch their own counters, so no locking is
+    needed. Comparing captured and rendered rates shows whether capture ever waits on the UI.
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self.start = time.perf_counter()
+        self.polls = 0
+        self.captured_bytes = 0
+        self.rendered_bytes = 0
+        self.frames = 0
+        self.max_backlog = 0
+        self.poll_interval = 0.0
+        self.peak_fill = 0.0        # largest single read as a fraction of the up buffer size
+        self.near_full = 0          # reads that found the up buffer at least 90% full
+        self.read_time = 0.0        # total time spent in the read pass of each poll
+        self.transfers = 0          # target memory accesses, counted by count_transfers()
+        self.counting = None        # thread whose accesses are counted, set during each poll pass
+        self.reattaches = 0         # automatic re-attaches after a reset or read error
+        self.reattach_time = 0.0    # how long the last one took
+
+    def record_fill(self, fill: float) -> None:
+        if fill > self.peak_fill:
+            self.peak_fill = fill
+        if fill >= 0.9:
+            self.near_full += 1
+
+    def summary(self) -> str:
+        elapsed = max(time.perf_counter() - self.start, 1e-6)
+        return ("capture %.1f KB/s (%d polls/s, %.1f ms)  render %.1f KB/s  backlog max %d chunks"
+                "  up buffer peak %d%% (%d near full)" %
+                (self.captured_bytes / 1024 / elapsed, self.polls / elapsed, self.poll_interval * 1000,
+                 self.rendered_bytes / 1024 / elapsed, self.max_backlog,
+                 self.peak_fill * 100, self.near_full) +
+                ("  re-attached %d (last %.1f ms)" % (self.reattaches, self.reattach_time * 1000)
+                 if self.reattaches else ""))
+
+
+class AdaptivePoller:
+    """@brief Poll interval scheduler for the RTT capture loop.
+
+    The interval doubles (by @a backoff) on each empty read up to @a max_interval, and drops back to
+    @a min_interval as soon as data arrives. When a read finds the up buffer more than half full the
+    next poll is issued immediately so the target does not overflow between polls. @a fill is the
+    largest read of the pass as a fraction of its up buffer size.
+    """
+    def __init__(self, min_interval: float, max_interval: float, backoff: float = 2.0):
+        self.min_interval = max(0.0, min_interval)
+        self.max_interval = max(self.min_interval, max_interval)
+        self.backoff = max(1.0, backoff)
+        self.interval = self.min_interval
+
+    @classmethod
+    def from_config(cls) -> "AdaptivePoller":
+        return cls(read_config_float("rtt_poll_min_ms", 1.0) / 1000,
+                   read_config_float("rtt_poll_max_ms", 50.0) / 1000,
+                   read_config_float("rtt_poll_backoff", 2.0))
+
+    def next_interval(self, nbytes: int, fill: float) -> float:
+        if nbytes == 0:
+            self.interval = min(max(self.interval, 0.0001) * self.backoff, self.max_interval)
+            return self.interval
+        self.interval = self.min_interval
+        if fill >= 0.5:
+            return 0.0
+        return self.interval
+
+
+def rtt_channel_size(chan) -> int:
+    """@brief Size of an RTT channel's target buffer, or the configured default if pyOCD doesn't expose it."""
+    for attr in ("size", "buf_size", "_size", "_buf_size"):
+        value = getattr(chan, attr, None)
+        if isinstance(value, int) and value > 0:
+            return value
+    return read_config_int("rtt_up_buffer_size", 1024)
+
+
+#每帧回调
+_frame_handlers = []
+
+def add_frame_handler(handler) -> None:
+    """@brief Register a function to be run on the render thread once per frame."""
+    _frame_handlers.append(handler)
+
+def run_frame_handlers() -> None:
+    for handler in _frame_handlers:
+        try:
+            handler()
+        except Exception:
+            LOG.exception("frame handler %r failed", handler)
+
+
+#UI线程调用
+_ui_calls: collections.deque = collections.deque()
+
+def ui_call(func, *args, **kwargs) -> None:
+    """@brief Run @a func on the render thread at the start of the next frame.
+
+    Worker threads use this instead of touching Dear PyGui directly.
+    """
+    _ui_calls.append((func, args, kwargs))
+
+def run_ui_calls() -> None:
+    while _ui_calls:
+        func, args, kwargs = _ui_calls.popleft()
+        func(*args, **kwargs)
+
+
+#后台任务
+class JobCancelled(Exception):
+    """@brief Raised inside a job once cancellation has been requested."""
+    pass
+
+class Job:
+    """@brief One unit of work run by JobExecutor.
+
+    The job function is called as func(job, *args). It reports progress through set_progress(),
+    which also raises JobCancelled once cancel() has been called, so pyOCD operations that take a
+    progress callback can be aborted between steps.
+    """
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    _ids = itertools.count(1)
+
+    def __init__(self, name: str, func, args: tuple):
+        self.id = next(Job._ids)
+        self.name = name
+        self.func = func
+        self.args = args
+        self.status = Job.QUEUED
+        self.progress = 0.0
+        self.message = ""
+        self.result = None
+        self.start_time = None
+        self.end_time = None
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+
+    @property
+    def elapsed(self) -> float:
+        if self.start_time is None:
+            return 0.0
+        return (self.end_time or time.perf_counter()) - self.start_time
+
+    @property
+    def finished(self) -> bool:
+        return self._done.is_set()
+
+    def cancel(self) -> None:
+        self._cancel.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def check_cancelled(self) -> None:
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def set_progress(self, progress: float) -> None:
+        self.progress = progress
+        self.check_cancelled()
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._done.wait(timeout)
+
+    def run(self) -> None:
+        if self.cancelled:
+            self.status = Job.CANCELLED
+            self._done.set()
+            return
+        self.status = Job.RUNNING
+        self.start_time = time.perf_counter()
+        try:
+            self.result = self.func(self, *self.args)
+            self.status = Job.DONE
+        except JobCancelled:
+            self.status = Job.CANCELLED
+        except Exception as e:
+            LOG.exception("Job '%s' failed", self.name)
+            self.message = str(e)
+            self.status = Job.FAILED
+        finally:
+            self.end_time = time.perf_counter()
+            self._done.set()
+
+
+class JobExecutor:
+    """@brief Small thread pool with a job queue for long-running target operations."""
+    def __init__(self, workers: int = 2, history: int = 20):
+        self.queue = queue.Queue()
+        self.jobs: collections.deque = collections.deque(maxlen=history)
+        self._threads = []
+        for i in range(max(1, workers)):
+            thread = threading.Thread(target=self._worker, name="job-%d" % i, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, name: str, func, *args) -> Job:
+        job = Job(name, func, args)
+        self.jobs.append(job)
+        self.queue.put(job)
+        return job
+
+    def _worker(self) -> None:
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+            job.run()
+
+    def cancel_all(self) -> None:
+        for job in list(self.jobs):
+            job.cancel()
+
+    def shutdown(self) -> None:
+        self.cancel_all()
+        for _ in self._threads:
+            self.queue.put(None)
+
+
+def job_cancel_callback(sender, app_data, user_data):
+    user_data.cancel()
+
+def update_job_table() -> None:
+    """@brief Frame handler mirroring job state into the job table and the flash progress bar."""
+    global _job_table_time
+    now = time.perf_counter()
+    if now - _job_table_time < 0.25 or not dpg.does_item_exist("job_table"):
+        return
+    _job_table_time = now
+    jobs = list(jobExecutor.jobs)
+    dpg.delete_item("job_table", children_only=True, slot=1)
+    for job in reversed(jobs):
+        with dpg.table_row(parent="job_table"):
+            dpg.add_text(str(job.id))
+            dpg.add_text(job.name)
+            dpg.add_text(job.status if not job.message else "%s: %s" % (job.status, job.message))
+            dpg.add_progress_bar(default_value=job.progress, width=150)
+            dpg.add_text("%.1fs" % job.elapsed)
+            if job.finished:
+                dpg.add_text("")
+            else:
+                dpg.add_button(label="取消", callback=job_cancel_callback, user_data=job)
+    running = [job for job in jobs if job.status == Job.RUNNING]
+    if running:
+        dpg.set_value("flash_progress_bar", running[-1].progress)
+
+_job_table_time = 0.0
+
+
+def new_rtt_log_buffer() -> RTTLogBuffer:
+    return RTTLogBuffer(max_lines=read_config_int("rtt_max_lines", 20000),
+                        max_bytes=read_config_int("rtt_max_bytes", 4 * 1024 * 1024),
+                        max_line=read_config_int("rtt_max_line", 4096))
+
+class RTTStreamDecoder:
+    """@brief Incremental bytes to text conversion for one RTT channel.
+
+    In text mode a UTF-8 sequence split across two reads is carried over to the next call instead
+    of raising. @a errors is the codec error policy; with "strict" a bad sequence is logged and
+    replaced so capture keeps running. Hex mode renders the raw stream as offset/hex/ASCII rows.
+    """
+    MODES = ("text", "hex")
+    HEX_WIDTH = 16
+
+    def __init__(self, mode: str = "text", errors: str = "replace"):
+        self.errors = errors
+        self.set_mode(mode)
+
+    def set_mode(self, mode: str) -> None:
+        self.mode = mode if mode in self.MODES else "text"
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors=self.errors)
+        self._offset = 0
+
+    def decode(self, data: bytes) -> str:
+        if self.mode == "hex":
+            return self._hexdump(data)
+        try:
+            return self._decoder.decode(data)
+        except UnicodeDecodeError as e:
+            LOG.warning("RTT channel data is not valid UTF-8 (%s)", e)
+            # the failed call left the carried bytes in place: decode them together with the new
+            # data, and keep carrying whatever incomplete sequence remains at the end
+            carried = self._decoder.getstate()[0]
+            fallback = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            text = fallback.decode(carried + data)
+            self._decoder.setstate(fallback.getstate())
+            return text
+
+    def _hexdump(self, data: bytes) -> str:
+        rows = []
+        width = self.HEX_WIDTH
+        for start in range(0, len(data), width):
+            row = data[start:start + width]
+            text = ''.join(chr(b) if 0x20 <= b < 0x7f else '.' for b in row)
+            rows.append("%08x  %-*s |%s|\n" % (self._offset + start, width * 3 - 1, row.hex(' '), text))
+        self._offset += len(data)
+        return ''.join(rows)
+
+
+RTT_DECODE_ERRORS = ("strict", "replace", "ignore", "backslashreplace")
+
+def rtt_decode_errors() -> str:
+    """@brief Codec error policy from rtt_decode_errors in config.ini, "replace" if unset or unknown."""
+    errors = read_config("rtt_decode_errors") or "replace"
+    if errors not in RTT_DECODE_ERRORS:
+        LOG.warning("invalid rtt_decode_errors '%s', expected one of %s; using 'replace'",
+                    errors, ", ".join(RTT_DECODE_ERRORS))
+        errors = "replace"
+    return errors
+
+def rtt_channel_mode(index: int) -> str:
+    hex_channels = [c.strip() for c in read_config("rtt_hex_channels").split(',')]
+    return "hex" if str(index) in hex_channels else "text"
+
+
+#遥测通道
+np = _LazyImport("numpy")
+
+def numpy_available() -> bool:
+    return importlib.util.find_spec("numpy") is not None
+
+# layout type names -> little-endian NumPy type codes
+TELEMETRY_TYPES = {"u8": "u1", "i8": "i1", "u16": "<u2", "i16": "<i2", "u32": "<u4", "i32": "<i4",
+                   "u64": "<u8", "i64": "<i8", "f32": "<f4", "f64": "<f8"}
+
+def parse_telemetry_layout(layout: str):
+    """@brief NumPy structured dtype for a record layout such as "t:u32, adc:i16[4], current:f32".
+
+    Fields are packed in order with no padding, as a packed C struct would be. Fields whose name
+    starts with "_" are decoded but not plotted.
+    """
+    fields = []
+    for item in layout.split(','):
+        m = re.fullmatch(r'\s*(\w+)\s*:\s*(\w+)\s*(?:\[\s*(\d+)\s*\])?\s*', item)
+        if m is None or m.group(2) not in TELEMETRY_TYPES:
+            raise ValueError("bad telemetry field '%s', expected name:type[count] with type one of %s"
+                             % (item.strip(), ", ".join(TELEMETRY_TYPES)))
+        name, kind, count = m.groups()
+        fields.append((name, TELEMETRY_TYPES[kind], (int(count),)) if count else (name, TELEMETRY_TYPES[kind]))
+    return np.dtype(fields)
+
+
+class TelemetryBuffer:
+    """@brief Rolling array of the last @a capacity records, written with vectorized slice copies."""
+    def __init__(self, dtype, capacity: int):
+        self.capacity = max(1, capacity)
+        self.data = np.zeros(self.capacity, dtype=dtype)
+        self.count = 0          # records ever added; the oldest one held is count - len(self)
+        self.version = 0
+
+    def __len__(self) -> int:
+        return min(self.count, self.capacity)
+
+    def clear(self) -> None:
+        self.count = 0
+        self.version += 1
+
+    def extend(self, records) -> None:
+        n = len(records)
+        if not n:
+            return
+        if n > self.capacity:
+            self.count += n - self.capacity
+            records = records[-self.capacity:]
+            n = self.capacity
+        start = self.count % self.capacity
+        first = min(n, self.capacity - start)
+        self.data[start:start + first] = records[:first]
+        self.data[:n - first] = records[first:]
+        self.count += n
+        self.version += 1
+
+    def last(self, n: int):
+        """@brief The newest @a n records (fewer if not available), oldest first."""
+        n = min(n, len(self))
+        end = self.count % self.capacity
+        if end >= n:
+            return self.data[end - n:end]
+        return np.concatenate((self.data[self.capacity - (n - end):], self.data[:end]))
+
+
+def minmax_decimate(values, first_index: int, buckets: int):
+    """@brief Reduce @a values to the min and max of each of @a buckets equal slices, in time order.
+
+    Keeps every peak visible while handing the plot at most 2 * @a buckets points. Returns
+    (x, y) arrays, x being record numbers starting at @a first_index.
+    """
+    n = len(values)
+    if n <= 2 * buckets:
+        return np.arange(first_index, first_index + n), values
+    size = n // buckets
+    skip = n - size * buckets           # the oldest few records that do not fill a slice
+    blocks = values[skip:].reshape(buckets, size)
+    lo = blocks.argmin(axis=1)
+    hi = blocks.argmax(axis=1)
+    base = np.arange(buckets) * size
+    index = np.empty(2 * buckets, dtype=np.int64)
+    index[0::2] = base + np.minimum(lo, hi)
+    index[1::2] = base + np.maximum(lo, hi)
+    return index + (first_index + skip), values[skip:][index]
+
+
+class TelemetryStream:
+    """@brief Decodes a binary RTT channel of fixed-layout records into a TelemetryBuffer.
+
+    Each batch of bytes is turned into records with one np.frombuffer call; a partial record is
+    carried over to the next batch. With @a sync the first field must hold that value in every
+    record; when it does not, the stream is re-aligned on the next occurrence of its bytes.
+    """
+    def __init__(self, layout: str, capacity: int = 1000000, sync: int = None):
+        self.layout = layout
+        self.dtype = parse_telemetry_layout(layout)
+        self.buffer = TelemetryBuffer(self.dtype, capacity)
+        self.sync = sync
+        self.dropped_bytes = 0
+        self._rest = b''
+        first = self.dtype[self.dtype.names[0]]
+        self._sync_bytes = None
+        if sync is not None:
+            if first.shape or first.kind not in "iu":
+                raise ValueError("sync needs an integer first field, not %s" % first)
+            info = np.iinfo(first)
+            if not info.min <= sync <= info.max:
+                raise ValueError("sync value %#x does not fit the first field (%s)" % (sync, first))
+            self._sync_bytes = np.array([sync], dtype=first).tobytes()
+        self.columns: List[Tuple[str, str, Optional[int]]] = []
+        for name in self.dtype.names:
+            if name.startswith('_'):
+                continue
+            shape = self.dtype[name].shape
+            if shape:
+                self.columns += [("%s[%d]" % (name, i), name, i) for i in range(shape[0])]
+            else:
+                self.columns.append((name, name, None))
+
+    @classmethod
+    def from_config(cls, index: int) -> Optional["TelemetryStream"]:
+        layout = read_config("rtt_telemetry_%d" % index)
+        if not layout:
+            return None
+        if not numpy_available():
+            LOG.warning("Channel %d has a telemetry layout but NumPy is not installed, showing it as text", index)
+            return None
+        sync = read_config("rtt_telemetry_sync_%d" % index)
+        try:
+            return cls(layout, read_config_int("rtt_telemetry_samples", 1000000), int(sync, 0) if sync else None)
+        except ValueError as e:
+            LOG.warning("Channel %d telemetry layout ignored: %s", index, e)
+            return None
+
+    def clear(self) -> None:
+        self._rest = b''
+        self.buffer.clear()
+
+    def feed(self, data: bytes) -> int:
+        """@brief Decode @a data; returns the number of complete records added."""
+        buf = self._rest + data
+        size = self.dtype.itemsize
+        added = 0
+        while len(buf) >= size:
+            records = np.frombuffer(buf, dtype=self.dtype, count=len(buf) // size)
+            if self.sync is not None:
+                bad = np.flatnonzero(records[self.dtype.names[0]] != self.sync)
+                if len(bad):
+                    records = records[:bad[0]]
+                    start = bad[0] * size
+                    found = buf.find(self._sync_bytes, start + 1)
+                    skip = (found if found >= 0 else max(start, len(buf) - len(self._sync_bytes) + 1)) - start
+                    self.buffer.extend(records)
+                    added += len(records)
+                    self.dropped_bytes += skip
+                    buf = buf[start + skip:]
+                    continue
+            self.buffer.extend(records)
+            added += len(records)
+            buf = buf[len(records) * size:]
+        self._rest = buf
+        return added
+
+    def summary(self) -> str:
+        return "%s  |  %d samples%s" % (self.layout, self.buffer.count,
+                                         ", %d bytes dropped resyncing" % self.dropped_bytes if self.dropped_bytes else "")
+
+
+class TelemetryView:
+    """@brief Line plot of a TelemetryStream's columns, min/max decimated to about the plot's width.
+
+    Redrawn at most every @a period seconds; new samples in between only bump the buffer version.
+    """
+    def __init__(self, stream: TelemetryStream, tag: str, window: int = None, buckets: int = 1000,
+                 period: float = 0.1):
+        self.stream = stream
+        self.tag = tag
+        self.window = window or stream.buffer.capacity
+        self.buckets = buckets
+        self.period = period
+        self._shown = None
+        self._drawn = 0.0
+
+    def refresh(self, force: bool = False) -> None:
+        buf = self.stream.buffer
+        if (buf.version == self._shown and not force) or not dpg.does_item_exist(self.tag + "_plot"):
+            return
+        now = time.perf_counter()
+        if not force and (now - self._drawn < self.period or not dpg.is_item_visible(self.tag + "_plot")):
+            return
+        self._shown = buf.version
+        self._drawn = now
+        records = buf.last(self.window)
+        first = buf.count - len(records)
+        for label, name, element in self.stream.columns:
+            values = records[name] if element is None else records[name][:, element]
+            x, y = minmax_decimate(values, first, self.buckets)
+            dpg.set_value("%s_%s" % (self.tag, label), [x.tolist(), y.astype(np.float64).tolist()])
+        dpg.set_value(self.tag + "_info", self.stream.summary())
+        dpg.fit_axis_data(self.tag + "_x")
+        dpg.fit_axis_data(self.tag + "_y")
+
+def add_telemetry_widgets(state: "RTTChannelState") -> None:
+    tag = state.text_tag
+    dpg.add_text(tag=tag + "_info", default_value=state.telemetry.summary())
+    with dpg.plot(tag=tag + "_plot", height=-1, width=-1):
+        dpg.add_plot_legend()
+        dpg.add_plot_axis(dpg.mvXAxis, label="sample", tag=tag + "_x")
+        with dpg.plot_axis(dpg.mvYAxis, tag=tag + "_y"):
+            for label, _, _ in state.telemetry.columns:
+                dpg.add_line_series([], [], label=label, tag="%s_%s" % (tag, label))
+
+
+class RTTChannelState:
+    """@brief Capture queue, log buffer and view of one RTT up channel.
+
+    A channel with a telemetry layout in config.ini (rtt_telemetry_<index>) is decoded into
+    @a telemetry and shown as a plot instead of text.
+    """
+    def __init__(self, index: int, name: str = ""):
+        self.index = index
+        self.name = name
+        self.capacity = read_config_int("rtt_up_buffer_size", 1024)
+        self.captured_bytes = 0
+        self.decoder = RTTStreamDecoder(rtt_channel_mode(index), rtt_decode_errors())
+        # capture thread appends raw chunks, the render thread pops them; deque append/popleft are atomic
+        self.pending: collections.deque = collections.deque()
+        self.log = new_rtt_log_buffer()
+        self.log_index = RTTLogIndex(self.log)
+        self._tags_version = 0
+        self.text_tag = "rtt_log" if index == 0 else "rtt_log_%d" % index
+        self.view = RTTLogView(self.log, self.text_tag, self.text_tag + "_scroll", "rtt_log_follow",
+                               view_lines=read_config_int("rtt_view_lines", 200), index=self.log_index)
+        self.telemetry = TelemetryStream.from_config(index)
+        if self.telemetry is not None:
+            self.view = TelemetryView(self.telemetry, self.text_tag, read_config_int("rtt_telemetry_window", 0) or None)
+
+    def update_filter_widgets(self) -> None:
+        index = self.log_index
+        if self._tags_version != index.tags_version and dpg.does_item_exist(self.text_tag + "_tag"):
+            self._tags_version = index.tags_version
+            dpg.configure_item(self.text_tag + "_tag", items=[""] + sorted(index.tags))
+        if dpg.does_item_exist(self.text_tag + "_matches"):
+            if index.error:
+                status = index.error
+            elif index.active:
+                status = "%d matches" % len(index.matches)
+            else:
+                status = ""
+            dpg.set_value(self.text_tag + "_matches", status)
+
+    @property
+    def label(self) -> str:
+        return "%d %s" % (self.index, self.name) if self.name else str(self.index)
+
+
+def rtt_filter_callback(sender, app_data, user_data):
+    state: RTTChannelState = user_data
+    tag = state.text_tag
+    state.log_index.set_filter(dpg.get_value(tag + "_filter"), regex=dpg.get_value(tag + "_regex"),
+                           level=dpg.get_value(tag + "_level"), tag=dpg.get_value(tag + "_tag"))
+    state.update_filter_widgets()
+    state.view.refresh(force=True)
+
+def add_rtt_channel_widgets(state: RTTChannelState) -> None:
+    if state.telemetry is not None:
+        add_telemetry_widgets(state)
+    else:
+        add_rtt_log_widgets(state)
+
+def add_rtt_log_widgets(state: RTTChannelState) -> None:
+    tag = state.text_tag
+    with dpg.group(horizontal=True):
+        dpg.add_combo(tag=tag + "_mode", items=RTTStreamDecoder.MODES, default_value=state.decoder.mode,
+                      width=100, callback=lambda s, a, u: u.decoder.set_mode(a), user_data=state)
+        dpg.add_input_text(tag=tag + "_filter", hint="过滤/搜索", width=300, callback=rtt_filter_callback, user_data=state)
+        dpg.add_checkbox(tag=tag + "_regex", label="正则", callback=rtt_filter_callback, user_data=state)
+        dpg.add_combo(tag=tag + "_level", items=("",) + LOG_LEVELS, width=100, callback=rtt_filter_callback, user_data=state)
+        dpg.add_combo(tag=tag + "_tag", items=[""], width=150, callback=rtt_filter_callback, user_data=state)
+        dpg.add_text(tag=tag + "_matches", default_value="")
+    with dpg.group(horizontal=True):
+        dpg.add_slider_int(tag=state.view.scroll_tag, vertical=True, min_value=0, max_value=0, height=240,
+                           callback=rtt_scroll_callback, user_data=state.index)
+        dpg.add_input_text(tag=state.text_tag, multiline=True, readonly=True, width=-1, height=-1)
+
+
+#RTT录制
+class RTTRecordFile:
+    """@brief One channel's append-only log file plus its line-offset index.
+
+    The index (<name>.log.idx) is a flat array of native uint64 values, the byte offset where each
+    line of the log starts.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.log = open(path, 'ab')
+        self.idx = open(path + ".idx", 'ab')
+        self.size = self.log.tell()
+        if self.size == 0:
+            self.idx.write(array('Q', [0]).tobytes())
+
+    def write(self, data: bytes) -> None:
+        offsets = array('Q')
+        pos = data.find(b'\n')
+        while pos >= 0:
+            offsets.append(self.size + pos + 1)
+            pos = data.find(b'\n', pos + 1)
+        self.log.write(data)
+        self.idx.write(offsets.tobytes())
+        self.size += len(data)
+        self.log.flush()
+        self.idx.flush()
+
+    def close(self) -> None:
+        self.log.close()
+        self.idx.close()
+
+
+class RTTRecorder:
+    """@brief Records raw RTT channel data to disk on its own writer thread.
+
+    The capture thread only appends to a deque; the writer wakes every @a flush_interval seconds
+    and writes whatever accumulated as one batch per channel, so disk I/O never delays a poll.
+    """
+    def __init__(self, flush_interval: float = 0.2):
+        self.flush_interval = flush_interval
+        self.queue: collections.deque = collections.deque()
+        self.active = False
+        self.directory = None
+        self.bytes_written = 0
+        self._files: Dict[int, RTTRecordFile] = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, directory: str) -> None:
+        self.stop()
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.bytes_written = 0
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self.active = True
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self.active = False
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        for f in self._files.values():
+            f.close()
+        self._files.clear()
+
+    def write(self, index: int, data: bytes) -> None:
+        if self.active:
+            self.queue.append((index, data))
+
+    def channel_path(self, index: int) -> str:
+        return os.path.join(self.directory, "ch%d.log" % index)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            self._flush()
+        self._flush()
+
+    def _flush(self) -> None:
+        batches: Dict[int, List[bytes]] = {}
+        queue = self.queue
+        while queue:
+            index, data = queue.popleft()
+            batches.setdefault(index, []).append(data)
+        for index, chunks in batches.items():
+            f = self._files.get(index)
+            if f is None:
+                f = self._files[index] = RTTRecordFile(self.channel_path(index))
+            data = b''.join(chunks)
+            try:
+                f.write(data)
+            except OSError as e:
+                LOG.error("RTT recording write failed: %s", e)
+                continue
+            self.bytes_written += len(data)
+
+
+class RTTRecordingReader:
+    """@brief Random access to a recorded channel through mmap.
+
+    Neither the log nor its index is read into memory, so any line of a multi-GB capture can be
+    shown immediately. Call reload() to pick up data appended since the file was opened.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._log = None
+        self._idx = None
+        self._offsets = memoryview(b'').cast('Q')
+        self.reload()
+
+    def close(self) -> None:
+        self._offsets.release()
+        for m in (self._log, self._idx):
+            if m is not None:
+                m.close()
+        self._log = self._idx = None
+
+    def reload(self) -> None:
+        self.close()
+        self._log = self._map(self.path)
+        self._idx = self._map(self.path + ".idx")
+        if self._idx is None:
+            self._offsets = memoryview(b'').cast('Q')
+        else:
+            view = memoryview(self._idx)
+            offsets = view[:len(view) - len(view) % 8].cast('Q')
+            view.release()
+            # the index records where the line after each newline starts; after a trailing
+            # newline (or while the log lags the index) that line has no bytes yet
+            size = len(self._log) if self._log is not None else 0
+            self._offsets = offsets[:bisect.bisect_left(offsets, size)]
+            offsets.release()
+
+    @staticmethod
+    def _map(path: str):
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return None
+        with open(path, 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def get_window(self, start: int, count: int) -> str:
+        if self._log is None or not len(self._offsets):
+            return ''
+        n = len(self._offsets)
+        start = min(max(start, 0), n - 1)
+        stop = start + count
+        begin = self._offsets[start]
+        end = self._offsets[stop] if stop < n else len(self._log)
+        text = self._log[begin:end].decode("utf-8", errors="replace")
+        return text[:-1] if text.endswith('\n') else text
+
+
+class NullKBHit:
+    """@brief KBHit stand-in for when the console is not an input, e.g. in batch mode."""
+    def kbhit(self) -> bool:
+        return False
+
+    def set_normal_term(self) -> None:
+        pass
+
+
+#RTT控制块
+RTT_CONTROL_BLOCK_ID = b"SEGGER RTT"
+RTT_CONTROL_BLOCK_HEADER = 24       # acID[16], MaxNumUpBuffers, MaxNumDownBuffers
+RTT_SCAN_CHUNK = 16 * 1024
+
+def elf_symbol_addresses(path: Optional[str], names: Iterable[str]) -> Dict[str, int]:
+    """@brief Addresses of the ELF symbols @a names found in @a path."""
+    names = set(names)
+    if not names or not path or not os.path.isfile(path):
+        return {}
+    try:
+        with open(path, "rb") as f:
+            if f.read(4) != b"\x7fELF":
+                return {}
+            f.seek(0)
+            symtab = ELFFile(f).get_section_by_name(".symtab")
+            if symtab is None:
+                return {}
+            return {symbol.name: symbol["st_value"] for symbol in symtab.iter_symbols() if symbol.name in names}
+    except Exception as e:
+        LOG.warning("Reading symbols from %s failed: %s", path, e)
+        return {}
+
+def rtt_elf_address(path: Optional[str]) -> Optional[int]:
+    """@brief Address of the _SEGGER_RTT symbol in the ELF file @a path, or None."""
+    return elf_symbol_addresses(path, ["_SEGGER_RTT"]).get("_SEGGER_RTT")
+
+class RTTLocator:
+    """@brief Finds the RTT control block without scanning RAM when it can.
+
+    Tries, in order, the address where it was found last time for this target and firmware
+    (config.ini section [rtt_control_blocks]), the _SEGGER_RTT symbol of @a elf_path, and finally
+    a scan of the target's RAM. A candidate is accepted when its first bytes hold the control
+    block ID, which the firmware writes last when it initializes RTT.
+    """
+    def __init__(self, target_name: Optional[str], firmware_path: Optional[str] = None, elf_path: Optional[str] = None):
+        self.key = target_name or "default"
+        if firmware_path and os.path.isfile(firmware_path):
+            with open(firmware_path, "rb") as f:
+                self.key += ":" + hashlib.sha1(f.read()).hexdigest()[:16]
+        cached = read_config(self.key, section="rtt_control_blocks")
+        self.cached = int(cached, 16) if cached else None
+        self.symbol = rtt_elf_address(elf_path or firmware_path)
+        self.address: Optional[int] = None
+        self.source = ""
+
+    def candidates(self) -> List[Tuple[str, int]]:
+        found = [("last", self.address), ("cache", self.cached), ("elf", self.symbol)]
+        return [(source, address) for source, address in found if address is not None]
+
+    @staticmethod
+    def check(target, address: int) -> bool:
+        return bytes(target.read_memory_block8(address, len(RTT_CONTROL_BLOCK_ID))) == RTT_CONTROL_BLOCK_ID
+
+    @staticmethod
+    def scan(target) -> Optional[int]:
+        overlap = len(RTT_CONTROL_BLOCK_ID) - 1
+        for region in target.memory_map.get_regions_of_type(MemoryType.RAM):
+            tail = b''
+            for offset in range(0, region.length, RTT_SCAN_CHUNK):
+                data = tail + bytes(target.read_memory_block8(region.start + offset,
+                                                              min(RTT_SCAN_CHUNK, region.length - offset)))
+                found = data.find(RTT_CONTROL_BLOCK_ID)
+                if found >= 0:
+                    return region.start + offset - len(tail) + found
+                tail = data[-overlap:]
+        return None
+
+    def attach(self, target, scan: bool = True):
+        """@brief Start an RTTControlBlock at the first candidate that checks out.
+
+        Scans RAM only if @a scan is set or there is no candidate. Returns None if the control
+        block was not found.
+        """
+        start = time.perf_counter()
+        source = None
+        for source, address in self.candidates():
+            if self.check(target, address):
+                break
+        else:
+            address = self.scan(target) if scan or not self.candidates() else None
+            source = "scan"
+        if address is None:
+            return None
+        control_block = RTTControlBlock.from_target(target, address=address, size=RTT_CONTROL_BLOCK_HEADER)
+        control_block.start()
+        self.address, self.source = address, source
+        if self.cached != address:
+            self.cached = address
+            save_config(self.key, "0x%08x" % address, section="rtt_control_blocks")
+        LOG.info("RTT control block at 0x%08x (%s) in %.1f ms", address, source, (time.perf_counter() - start) * 1000)
+        return control_block
+
 
 class RTTThread:
     def __init__(self):
         self.thread = None
         self.alive = threading.Event()
+        self.channels: Dict[int, RTTChannelState] = {0: RTTChannelState(0)}
+        self.channels_version = 0
+        self._tabs_version = 0
+        self.down_names: List[str] = []
+        self.down_index = 0
+        self.outgoing: collections.deque = collections.deque()
+        self.stats = RTTStats()
+        self.recorder = RTTRecorder()
+        self.unique_id = None
+        self.pack_path = None
+        self.target_name = None
+        self.firmware_path = None       # image last selected, keys the cached control block address
+        self.console_input = True       # forward console keystrokes to the down channel
+        self._stats_time = 0.0
     
     def StartThread(self):
         """Start the receiver thread"""
@@ -322,37 +1928,181 @@ class RTTThread:
         self.StopThread()
 
     def Connect(self):
-        #todo:
+        # widgets are only read here on the render thread, the capture thread gets plain values
+        self.unique_id = selected_probe_uid()
+        self.pack_path = dpg.get_value("pack_path") or None
+        self.target_name = dpg.get_value("target_name") or None
+        self.firmware_path = dpg.get_value("bin_path") or None
+        self.stats.reset()
         self.StartThread()
         self.alive.set()
-    def viewer_loop(self,up_chan, down_chan, kb):
+
+    def send(self, data: bytes) -> None:
+        """@brief Queue bytes for the selected down channel; written by the capture thread."""
+        self.outgoing.append(data)
+
+    def clear(self) -> None:
+        for state in self.channels.values():
+            if state.telemetry is not None:
+                state.telemetry.clear()
+            state.log.clear()
+            state.log_index.reset()
+            state.update_filter_widgets()
+            state.view.refresh(force=True)
+
+    def refresh_views(self) -> None:
+        for state in self.channels.values():
+            state.view.refresh()
+
+    def set_channels(self, up_chans: Sequence[RTTUpChannel], down_chans: Sequence[RTTDownChannel]) -> None:
+        """@brief Adopt the channels found in the control block.
+
+        Called from the capture thread. Existing channel states are kept so the log survives a
+        reconnect; the render thread picks up the new layout through @a channels_version.
+        """
+        channels = {}
+        for index, chan in enumerate(up_chans):
+            state = self.channels.get(index) or RTTChannelState(index)
+            state.name = chan.name if chan.name is not None else ""
+            state.capacity = rtt_channel_size(chan)
+            channels[index] = state
+        self.channels = channels
+        self.down_names = ["%d %s" % (index, chan.name or "") for index, chan in enumerate(down_chans)]
+        if self.down_index >= len(down_chans):
+            self.down_index = 0
+        self.channels_version += 1
+
+    def _update_tabs(self) -> None:
+        self._tabs_version = self.channels_version
+        channels = self.channels
+        for child in dpg.get_item_children("rtt_tabs", 1):
+            index = dpg.get_item_user_data(child)
+            if index not in channels:
+                dpg.delete_item(child)
+        for index, state in sorted(channels.items()):
+            tab = "rtt_tab_%d" % index
+            if dpg.does_item_exist(tab):
+                dpg.configure_item(tab, label=state.label)
+                continue
+            with dpg.tab(tag=tab, label=state.label, parent="rtt_tabs", user_data=index):
+                add_rtt_channel_widgets(state)
+        dpg.configure_item("rtt_down_chan", items=self.down_names)
+        if self.down_names:
+            dpg.set_value("rtt_down_chan", self.down_names[self.down_index])
+
+    def drain(self) -> None:
+        """@brief Render-side consumer, run once per frame.
+
+        Everything captured since the previous frame is batched into a single log append and at
+        most one widget update per channel.
+        """
+        if self._tabs_version != self.channels_version:
+            self._update_tabs()
+        for state in list(self.channels.values()):
+            nbytes, lines = self.consume(state)
+            if lines:
+                state.update_filter_widgets()
+            if nbytes:
+                state.view.refresh()
+        self.stats.frames += 1
+        now = time.perf_counter()
+        if now - self._stats_time >= 0.5 and self.thread is not None:
+            self._stats_time = now
+            dpg.set_value("rtt_stats", self.stats.summary())
+            if self.recorder.active:
+                dpg.set_value("rtt_record_status", "%s  %.1f KB" % (self.recorder.directory,
+                                                                   self.recorder.bytes_written / 1024))
+
+    def consume(self, state: RTTChannelState) -> Tuple[int, List[str]]:
+        """@brief Move everything captured on one channel into its log and index.
+
+        Returns the number of bytes taken and the complete lines they produced. Does not touch any
+        widget, so it also runs headless.
+        """
+        chunks = []
+        pending = state.pending
+        while pending:
+            chunks.append(pending.popleft())
+        if not chunks:
+            return 0, []
+        data = b''.join(chunks)
+        self.stats.rendered_bytes += len(data)
+        if state.telemetry is not None:
+            state.telemetry.feed(data)
+            return len(data), []
+        start_seq, lines = state.log.append(state.decoder.decode(data))
+        if lines:
+            state.log_index.add_lines(start_seq, lines)
+        return len(data), lines
+
+    def viewer_loop(self, up_chans, down_chans, kb, lock, link=None) -> bool:
+        """@brief Capture loop; returns True if the link to the target was lost, False when stopped.
+
+        @a link, if given, is called with the seconds since data last arrived and returns False
+        once the control block is gone, e.g. after a target reset.
+        """
         # byte array to send via RTT
         cmd = bytes()
-        log_buff = ''
+        poller = AdaptivePoller.from_config()
+        states = [self.channels[index] for index in range(len(up_chans))]
+        stats = self.stats
+        recorder = self.recorder
+        interval = 0.0
+        last_data = time.perf_counter()
         while self.alive.is_set():
-            # poll at most 1000 times per second to limit CPU use
-            sleep(0.001)
-
-            # read data from up buffer 0 (target -> host) and write to
-            # stdout
+            # back off while the channels are idle, poll flat out while they are busy
+            if interval:
+                sleep(interval)
+            if link is not None and not link(time.perf_counter() - last_data):
+                return True
+
+            # drain every up channel (target -> host) in one pass
+            nbytes = 0
+            fill = 0.0
             try:
-                up_data: bytes = up_chan.read()
-                log_buff = log_buff + str(up_data, encoding = "utf-8") 
-                #dpg.configure_item("tty_text",default_value = log_buff)
-                dpg.set_value("rtt_log", log_buff)
-            except:
-                break
+                read_start = time.perf_counter()
+                with lock:
+                    # only the poll pass counts towards transfers, not flash jobs or the watch window
+                    stats.counting = threading.get_ident()
+                    try:
+                        datas = [up_chan.read() for up_chan in up_chans]
+                    finally:
+                        stats.counting = None
+                stats.read_time += time.perf_counter() - read_start
+                for up_data, state in zip(datas, states):
+                    if not up_data:
+                        continue
+                    state.pending.append(up_data)
+                    recorder.write(state.index, up_data)
+                    state.captured_bytes += len(up_data)
+                    nbytes += len(up_data)
+                    fill = max(fill, len(up_data) / state.capacity)
+                    stats.max_backlog = max(stats.max_backlog, len(state.pending))
+            except Exception as e:
+                LOG.warning("RTT read failed: %s", e)
+                return True
+            stats.polls += 1
+            stats.captured_bytes += nbytes
+            if nbytes:
+                last_data = time.perf_counter()
+                stats.record_fill(fill)
+            interval = poller.next_interval(nbytes, fill)
+            stats.poll_interval = interval
         
             #sys.stdout.buffer.write(up_data)
             #sys.stdout.buffer.flush()
             #print(up_data, end="", flush=True)
 
+            # input typed in the GUI
+            while self.outgoing:
+                cmd += self.outgoing.popleft()
+
             # try to fetch character
             if kb.kbhit():
                 c: str = kb.getch()
 
                 if ord(c) == 27: # process ESC
-                    break
+                    return False
                 elif c.isprintable() or c == '\n':
                     print(c, end="", flush=True)
 
@@ -362,75 +2112,143 @@ class RTTThread:
             # write buffer to target
             if not cmd:
                 continue
+            if not down_chans:
+                LOG.warning("No down channel to write to, dropping %d bytes", len(cmd))
+                cmd = bytes()
+                continue
 
-            # write cmd buffer to down buffer 0 (host -> target)
-            bytes_out = down_chan.write(cmd)
+            # write cmd buffer to the selected down buffer (host -> target)
+            down_chan: RTTDownChannel = down_chans[min(self.down_index, len(down_chans) - 1)]
+            try:
+                with lock:
+                    bytes_out = down_chan.write(cmd)
+            except Exception as e:
+                LOG.warning("RTT write failed: %s", e)
+                return True
             cmd = cmd[bytes_out:]
+            interval = poller.min_interval
+        return False
 
-    def ComPortThread(self):
-        print("ComPortThread Start----")
-        session = None
-        kb = None
-        pack_path = dpg.get_value("pack_path");
-        print("pack_path\n")
-        if len(pack_path)==0 :
-            pack_path = None
-        target_name = dpg.get_value("target_name");
-        if len(target_name)==0 :
-            target_name = None
-        try:
-            session = ConnectHelper.session_with_chosen_probe(
-                pack=pack_path,
-                target_override=target_name,
-                options=convert_session_options(None),
-                )
-
-            if session is None:
-                LOG.error("No target device available")
-                return 1
+    def attach(self, manager: SessionManager, locator: RTTLocator, scan: bool = True):
+        """@brief Find the control block on the session manager's target and adopt its channels.
 
-            with session:
+        Returns (target, up channels, down channels), or None if no control block was found.
+        """
+        with manager.lock:
+            session = manager.get(self.unique_id, self.pack_path, self.target_name)
 
-                target: SoCTarget = session.board.target
+            target: SoCTarget = session.board.target
+            count_transfers(target, self.stats)
 
-                control_block = RTTControlBlock.from_target(target)
-                control_block.start()
+            control_block = locator.attach(target, scan)
+            if control_block is None:
+                return None
 
-                if len(control_block.up_channels) < 1:
-                    LOG.error("No up channels.")
-                    return 1
+            if len(control_block.up_channels) < 1:
+                raise RuntimeError("No up channels.")
 
-                LOG.info(f"{len(control_block.up_channels)} up channels and "
-                            f"{len(control_block.down_channels)} down channels found")
+            LOG.info(f"{len(control_block.up_channels)} up channels and "
+                        f"{len(control_block.down_channels)} down channels found")
 
-                up_chan: RTTUpChannel = control_block.up_channels[0]
-                up_name = up_chan.name if up_chan.name is not None else ""
-                LOG.info(f"Reading from up channel {0} (\"{up_name}\")")
+            up_chans: List[RTTUpChannel] = list(control_block.up_channels)
+            down_chans: List[RTTDownChannel] = list(control_block.down_channels)
+            for index, chan in enumerate(up_chans):
+                LOG.info(f"Reading from up channel {index} (\"{chan.name or ''}\")")
+            if not down_chans:
+                LOG.warning("No down channels.")
+            self.set_channels(up_chans, down_chans)
+            return target, up_chans, down_chans
+
+    def reattach(self, manager: SessionManager, locator: RTTLocator):
+        """@brief Attach again after a reset or read error, on the same session if it is still healthy.
+
+        Known addresses are retried every few milliseconds while the firmware starts up; RAM is
+        only scanned after rtt_reattach_scan_ms. Keeps trying until found or stopped.
+        """
+        start = time.perf_counter()
+        scan_after = read_config_float("rtt_reattach_scan_ms", 500) / 1000
+        delay = 0.002
+        failures = 0
+        while self.alive.is_set():
+            try:
+                found = self.attach(manager, locator, scan=time.perf_counter() - start >= scan_after)
+            except Exception as e:
+                (LOG.warning if failures == 0 else LOG.debug)("RTT re-attach failed: %s", e)
+                failures += 1
+                found = None
+            if found is not None:
+                elapsed = time.perf_counter() - start
+                self.stats.reattaches += 1
+                self.stats.reattach_time = elapsed
+                LOG.info("RTT re-attached in %.1f ms", elapsed * 1000)
+                return found
+            sleep(delay)
+            # stay responsive while the target is likely just booting, then back off
+            delay = min(delay * 2, 0.05 if time.perf_counter() - start < 2 else 1.0)
+        return None
+
+    def link_check(self, manager: SessionManager, locator: RTTLocator, target):
+        """@brief Build the viewer_loop link check for @a target.
+
+        A reset done through the session manager is noticed right away; one by other means (the
+        reset button, a watchdog) is noticed by re-reading the control block ID once the channels
+        have been idle for rtt_check_interval_ms.
+        """
+        resets = manager.resets
+        interval = read_config_float("rtt_check_interval_ms", 1000) / 1000
+        last_check = time.perf_counter()
+
+        def link(idle: float) -> bool:
+            nonlocal last_check
+            if manager.resets != resets:
+                return False
+            now = time.perf_counter()
+            if idle < interval or now - last_check < interval:
+                return True
+            last_check = now
+            try:
+                with manager.lock:
+                    return locator.check(target, locator.address)
+            except Exception:
+                return False
+        return link
 
-                # some targets might need this here
-                #target.reset_and_halt()
+    def ComPortThread(self):
+        print("ComPortThread Start----")
+        kb = None
+        manager = sessionManager
+        try:
+            locator = RTTLocator(self.target_name, self.firmware_path, read_config("rtt_elf") or None)
+            # the session stays open in the session manager after RTT stops
+            found = self.attach(manager, locator)
+            if found is None:
+                LOG.error("No RTT control block found.")
+                return 1
+            target, up_chans, down_chans = found
 
-                target.resume()
+            # some targets might need this here
+            #target.reset_and_halt()
 
-                # set up terminal input
-                kb = KBHit()
+            with manager.lock:
+                target.resume()
 
-                if len(control_block.down_channels) < 1:
-                    LOG.error("No down channels.")
-                    return 1
-                down_chan: RTTDownChannel = control_block.down_channels[0]
-                down_name = down_chan.name if down_chan.name is not None else ""
-                LOG.info(f"Writing to down channel {0} (\"{down_name}\")")
+            # set up terminal input
+            kb = KBHit() if self.console_input else NullKBHit()
 
-                self.viewer_loop(up_chan, down_chan, kb)
-                print("RTT closed")
+            while self.viewer_loop(up_chans, down_chans, kb, manager.lock, self.link_check(manager, locator, target)):
+                found = self.reattach(manager, locator)
+                if found is None:
+                    break
+                target, up_chans, down_chans = found
+            print("RTT closed")
 
         except KeyboardInterrupt:
             pass
 
+        except Exception as e:
+            LOG.error("RTT connect failed: %s", e)
+
         finally:
-            if session:
-                session.close()
             if kb:
                 kb.set_normal_term()
 
@@ -587,6 +2405,12 @@ def load_targets():
                         file_format=None)
 def _on_demo_close(sender, app_data, user_data):
     rttThread.DisConnect()
+    memoryWatcher.stop()
+    rttThread.recorder.stop()
+    jobExecutor.shutdown()
+    probeWatcher.stop()
+    sessionManager.close()
+    configStore.flush()
     dpg.delete_item(sender)
 
 def menu_callback(sender, app_data, user_data):
@@ -597,36 +2421,294 @@ def menu_callback(sender, app_data, user_data):
                 print("show pack")
         elif sender == ID_MENU_CLEAN_PACK:
                 print("clean pack")
+#Pack目录缓存
+class PackCatalog:
+    """@brief On-disk cache of the target lists shown in the Pack table.
+
+    A pack's targets (name, vendor, part number, families, memory map) are parsed once and stored
+    as gzipped JSON named after the pack's SHA-1, so a pack is only re-parsed when its content
+    changes. The path/mtime/size -> SHA-1 mapping is kept in index.json, so an unchanged pack is
+    not even re-hashed. The builtin target list is cached per pyOCD version, the targets of packs
+    installed with cmsis-pack-manager until the manager's cache directory changes.
+    """
+    FORMAT = 2      # 2: pack target names normalised like pyOCD does
+
+    def __init__(self, directory: str = None):
+        self.directory = directory or cache_dir("catalog")
+        self._index_path = os.path.join(self.directory, "index.json")
+        self._memo: Dict[str, List[Dict[str, Any]]] = {}
+
+    @staticmethod
+    def _read(path: str):
+        try:
+            with gzip.open(path, 'rt', encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError, EOFError):
+            return None
+
+    @staticmethod
+    def _write(path: str, obj) -> None:
+        temp = path + ".tmp"
+        with gzip.open(temp, 'wt', encoding="utf-8") as f:
+            json.dump(obj, f, separators=(',', ':'))
+        os.replace(temp, path)
+
+    def _load_index(self) -> Dict[str, Any]:
+        try:
+            with open(self._index_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def fingerprint(self, pack_path: str) -> str:
+        """@brief SHA-1 of the pack, rehashed only when its path, mtime or size changed."""
+        pack_path = os.path.abspath(pack_path)
+        st = os.stat(pack_path)
+        index = self._load_index()
+        entry = index.get(pack_path)
+        if entry and entry["mtime"] == st.st_mtime and entry["size"] == st.st_size:
+            return entry["sha1"]
+        sha1 = hashlib.sha1()
+        with open(pack_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha1.update(block)
+        index[pack_path] = {"mtime": st.st_mtime, "size": st.st_size, "sha1": sha1.hexdigest()}
+        temp = self._index_path + ".tmp"
+        with open(temp, 'w', encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(temp, self._index_path)
+        return index[pack_path]["sha1"]
+
+    @staticmethod
+    def _memory_map(device) -> List[Dict[str, Any]]:
+        regions = []
+        for region in device.memory_map:
+            info = {"name": region.name, "type": region.type.name, "start": region.start, "length": region.length}
+            if region.is_flash:
+                info["blocksize"] = region.blocksize
+            regions.append(info)
+        return regions
+
+    @classmethod
+    def _device_info(cls, device) -> Dict[str, Any]:
+        return {
+            # the name pyOCD registers the device under, so it works as target_override
+            "name": normalise_target_type_name(device.part_number),
+            "vendor": device.vendor,
+            "part_number": device.part_number,
+            "part_families": list(device.families),
+            "source": "pack",
+            "memory_map": cls._memory_map(device),
+            }
+
+    def pack_targets(self, pack_path: str) -> List[Dict[str, Any]]:
+        key = self.fingerprint(pack_path)
+        if key in self._memo:
+            return self._memo[key]
+        path = os.path.join(self.directory, "pack-%s.json.gz" % key)
+        record = self._read(path)
+        if record is None or record.get("format") != self.FORMAT:
+            start = time.perf_counter()
+            pack = CmsisPack(pack_path)
+            targets = [self._device_info(device) for device in pack.devices]
+            record = {"format": self.FORMAT, "pack": os.path.basename(pack_path), "targets": targets}
+            self._write(path, record)
+            LOG.info("Parsed %d targets from %s in %.2fs", len(targets), pack_path, time.perf_counter() - start)
+        self._memo[key] = record["targets"]
+        return record["targets"]
+
+    def builtin_targets(self) -> List[Dict[str, Any]]:
+        key = "builtin-%s" % getattr(pyocd, "__version__", "unknown")
+        if key in self._memo:
+            return self._memo[key]
+        path = os.path.join(self.directory, "%s.json.gz" % key)
+        record = self._read(path)
+        if record is None or record.get("format") != self.FORMAT:
+            obj = ListGenerator.list_targets(name_filter=None, vendor_filter=None, source_filter="builtin")
+            targets = [{k: info[k] for k in ("name", "vendor", "part_number", "part_families", "source")}
+                       for info in obj['targets']]
+            record = {"format": self.FORMAT, "targets": targets}
+            self._write(path, record)
+        self._memo[key] = record["targets"]
+        return record["targets"]
+
+    @staticmethod
+    def managed_fingerprint() -> Optional[str]:
+        """@brief Digest of the cmsis-pack-manager cache directory listing, None without the manager."""
+        if importlib.util.find_spec("cmsis_pack_manager") is None:
+            return None
+        import cmsis_pack_manager
+        root = cmsis_pack_manager.Cache(True, True).data_path
+        sha1 = hashlib.sha1()
+        for directory, _, files in sorted(os.walk(root)):
+            for name in sorted(files):
+                st = os.stat(os.path.join(directory, name))
+                sha1.update(("%s/%s %d %d\n" % (directory, name, st.st_size, st.st_mtime_ns)).encode("utf-8"))
+        return sha1.hexdigest()
+
+    def managed_targets(self) -> List[Dict[str, Any]]:
+        """@brief Targets of the packs installed with cmsis-pack-manager, cached until that set changes."""
+        try:
+            fingerprint = self.managed_fingerprint()
+        except Exception as e:
+            LOG.warning("Reading the cmsis-pack-manager cache failed: %s", e)
+            return []
+        if fingerprint is None:
+            return []
+        key = "managed-%s" % fingerprint
+        if key in self._memo:
+            return self._memo[key]
+        path = os.path.join(self.directory, "%s.json.gz" % key)
+        record = self._read(path)
+        if record is None or record.get("format") != self.FORMAT:
+            start = time.perf_counter()
+            targets = [self._device_info(device) for device in pack_target.ManagedPacks.get_installed_targets()]
+            record = {"format": self.FORMAT, "targets": targets}
+            self._write(path, record)
+            LOG.info("Listed %d installed pack targets in %.2fs", len(targets), time.perf_counter() - start)
+        self._memo[key] = record["targets"]
+        return record["targets"]
+
+    def targets(self, pack_path: Optional[str]) -> List[Dict[str, Any]]:
+        """@brief Builtin, installed pack and selected pack targets, sorted by name.
+
+        On a name clash the selected pack wins over installed packs, which win over builtin targets,
+        as in pyOCD itself.
+        """
+        merged = {info['name']: info for info in self.builtin_targets()}
+        merged.update((info['name'], info) for info in self.managed_targets())
+        if pack_path:
+            merged.update((info['name'], info) for info in self.pack_targets(pack_path))
+        return sorted(merged.values(), key=lambda i: i['name'])
+
+packCatalog: Optional[PackCatalog] = None
+
+#Target列表
+TARGET_COLUMNS = ("name", "vendor", "part_number", "part_families", "source")
+
+class TargetTableView:
+    """@brief Virtualized, filterable view of the target catalog in the pack table.
+
+    The table holds a fixed pool of @a page_size rows that are relabelled as the view scrolls, so
+    the widget count does not grow with the catalog. The type-ahead filter uses a trigram index
+    over name, vendor, part number and families built once per catalog; a query that extends the
+    previous one only re-checks the previous result.
+    """
+    def __init__(self, table_tag: str, scroll_tag: str, page_size: int = 20):
+        self.table_tag = table_tag
+        self.scroll_tag = scroll_tag
+        self.page_size = max(1, page_size)
+        self.rows: List[Dict[str, Any]] = []
+        self.keys: List[str] = []
+        self.trigrams: Dict[str, set] = {}
+        self.query = ''
+        self.filtered: List[int] = []
+        self.offset = 0
+        self._pool: List[Tuple[int, List[int]]] = []
+
+    def build_pool(self) -> None:
+        """@brief Create the pooled table rows; called once while the table is being built."""
+        for _ in range(self.page_size):
+            with dpg.table_row(parent=self.table_tag, show=False) as row:
+                cells = [dpg.add_selectable(label="", span_columns=True, callback=clb_selectable)
+                         for _ in TARGET_COLUMNS]
+            self._pool.append((row, cells))
+
+    @staticmethod
+    def cell_text(info: Dict[str, Any], column: str) -> str:
+        value = info.get(column) or ''
+        return ', '.join(value) if isinstance(value, list) else str(value)
+
+    def set_rows(self, rows: List[Dict[str, Any]]) -> None:
+        self.index_rows(rows)
+        self.set_filter(dpg.get_value("target_filter") if dpg.does_item_exist("target_filter") else '')
+
+    def index_rows(self, rows: List[Dict[str, Any]]) -> None:
+        self.rows = rows
+        self.keys = [' '.join(self.cell_text(info, column) for column in TARGET_COLUMNS[:4]).lower()
+                     for info in rows]
+        trigrams: Dict[str, set] = {}
+        for i, key in enumerate(self.keys):
+            for j in range(len(key) - 2):
+                trigrams.setdefault(key[j:j + 3], set()).add(i)
+        self.trigrams = trigrams
+        self.query = None
+
+    def set_filter(self, query: str) -> None:
+        if self.apply_filter(query):
+            self.offset = 0
+            self.refresh()
+
+    def apply_filter(self, query: str) -> bool:
+        """@brief Update @a filtered for @a query without touching the table; False if unchanged."""
+        query = (query or '').strip().lower()
+        if query == self.query:
+            return False
+        if self.query and query.startswith(self.query):
+            candidates = self.filtered
+        elif len(query) >= 3:
+            sets = sorted((self.trigrams.get(query[j:j + 3], set()) for j in range(len(query) - 2)), key=len)
+            candidates = sorted(set.intersection(*sets))
+        else:
+            candidates = range(len(self.rows))
+        self.filtered = [i for i in candidates if query in self.keys[i]] if query else list(candidates)
+        self.query = query
+        return True
+
+    def scroll(self, offset: int) -> None:
+        self.offset = offset
+        self.refresh()
+
+    def refresh(self) -> None:
+        last = max(0, len(self.filtered) - self.page_size)
+        self.offset = min(max(self.offset, 0), last)
+        if dpg.does_item_exist(self.scroll_tag):
+            dpg.configure_item(self.scroll_tag, max_value=last)
+            dpg.set_value(self.scroll_tag, last - self.offset)   # vertical slider: top is the maximum
+        for n, (row, cells) in enumerate(self._pool):
+            i = self.offset + n
+            if i >= len(self.filtered):
+                dpg.configure_item(row, show=False)
+                continue
+            info = self.rows[self.filtered[i]]
+            dpg.configure_item(row, show=True)
+            for cell, column in zip(cells, TARGET_COLUMNS):
+                dpg.configure_item(cell, label=self.cell_text(info, column), user_data=info['name'])
+                dpg.set_value(cell, False)
+        if dpg.does_item_exist("target_count"):
+            dpg.set_value("target_count", "%d / %d" % (len(self.filtered), len(self.rows)))
+
+targetTable: Optional[TargetTableView] = None
+
+def target_filter_callback(sender, app_data):
+    targetTable.set_filter(app_data)
+
+def target_scroll_callback(sender, app_data):
+    targetTable.scroll(dpg.get_item_configuration(sender)["max_value"] - app_data)
+
+def target_wheel_callback(sender, app_data):
+    if targetTable is not None and dpg.is_item_hovered("pack_table"):
+        targetTable.scroll(targetTable.offset - int(app_data) * 3)
+
 def show_target(sender, app_data):
     print('show_target.')
     print("Sender: ", sender)
     print("App Data: ", app_data)
+    global packCatalog
     pack_path = dpg.get_value("pack_path");
     print("pack_path\n")
     if len(pack_path)==0 :
         pack_path = None
-    session = Session(None,
-                        project_dir=None,
-                        config_file=None,
-                        no_config=None,
-                        pack=pack_path, 
-                        **convert_session_options(None)
-                        )
+    if packCatalog is None:
+        packCatalog = PackCatalog()
+    try:
+        targets = packCatalog.targets(pack_path)
+    except Exception as e:
+        LOG.error("Loading targets failed: %s", e)
+        return
+
+    targetTable.set_rows(targets)
 
-    if session.options['pack'] is not None:
-        pack_target.PackTargets.populate_targets_from_pack(session.options['pack'])
-    obj = ListGenerator.list_targets(name_filter=None,
-                                            vendor_filter=None,
-                                            source_filter=None)
-    
-    for info in sorted(obj['targets'], key=lambda i: i['name']):
-        with dpg.table_row(parent="pack_table"):
-            dpg.add_selectable(label=info['name'], span_columns=True, callback=clb_selectable, user_data=info['name'])
-            dpg.add_selectable(label=info['vendor'], span_columns=True, callback=clb_selectable, user_data=info['name'])
-            dpg.add_selectable(label=info['part_number'], span_columns=True, callback=clb_selectable, user_data=info['name'])
-            dpg.add_selectable(label=', '.join(info['part_families']), span_columns=True, callback=clb_selectable, user_data=info['name'])
-            dpg.add_selectable(label=info['source'], span_columns=True, callback=clb_selectable, user_data=info['name'])
-        
 
 def pack_callback(sender, app_data):
     print('OK was clicked.')
@@ -634,18 +2716,48 @@ def pack_callback(sender, app_data):
     print("App Data: ", app_data)
     dpg.set_value("pack_path", app_data['file_path_name'])
     save_config("pack_path",app_data['file_path_name'])
+    sessionManager.invalidate()
+
+def apply_profile_widgets() -> None:
+    dpg.set_value("pack_path", read_config("pack_path"))
+    dpg.set_value("target_name", read_config("target_name"))
+    dpg.set_value("bin_path", read_config("bin_path"))
+    dpg.set_value("swd_frequency", swd_frequency_setting_label())
+    dpg.set_value("delta_flash", read_config("delta_flash") == "1")
+    dpg.set_value("flash_verify", read_config("flash_verify") != "0")
+    sessionManager.invalidate()
+
+def profile_callback(sender, app_data):
+    if load_profile(app_data):
+        dpg.set_value("profile_name", app_data)
+        apply_profile_widgets()
+
+def profile_save_callback(sender, app_data):
+    name = dpg.get_value("profile_name").strip()
+    if not name:
+        return
+    save_profile(name)
+    dpg.configure_item("profile", items=profile_names())
+    dpg.set_value("profile", name)
+
+def profile_delete_callback(sender, app_data):
+    delete_profile(dpg.get_value("profile"))
+    dpg.configure_item("profile", items=profile_names())
+    dpg.set_value("profile", "")
 
 def intput_callback(sender, app_data, user_data):
     print(f"sender is: {sender}")
     print(f"app_data is: {app_data}")
     print(f"user_data is: {user_data}")
     save_config(str(sender), str(app_data))
+    sessionManager.invalidate()
 
 
 def clb_selectable(sender, app_data, user_data):
     print(f"Row {user_data}")
     dpg.set_value("target_name", user_data)
     save_config("target_name",user_data)
+    sessionManager.invalidate()
 
 def bin_callback(sender, app_data):
     print('OK was clicked.')
@@ -653,6 +2765,8 @@ def bin_callback(sender, app_data):
     print("App Data: ", app_data)
     dpg.set_value("bin_path", app_data['file_path_name'])
     save_config("bin_path", app_data['file_path_name'])
+    # start parsing now so programming does not wait for it
+    imageCache.prepare(app_data['file_path_name'], flash_sector_guess(dpg.get_value("target_name") or None))
 
 
 def rtt_connect_callback(sender, app_data):
@@ -670,130 +2784,1624 @@ def rtt_clear_callback(sender, app_data):
     print('OK was clicked.')
     print("Sender: ", sender)
     print("App Data: ", app_data)
-    dpg.set_value("rtt_log", "")
+    rttThread.clear()
+
+def rtt_record_start_callback(sender, app_data):
+    base = read_config("rtt_record_dir") or os.path.join(os.path.dirname(file_path), "rtt_records")
+    directory = os.path.join(base, time.strftime("%Y%m%d_%H%M%S"))
+    rttThread.recorder.start(directory)
+    dpg.set_value("rtt_record_status", directory)
+
+def rtt_record_stop_callback(sender, app_data):
+    rttThread.recorder.stop()
+    if rttThread.recorder.directory:
+        dpg.set_value("rtt_record_status", "%s  %.1f KB (stopped)" % (rttThread.recorder.directory,
+                                                                     rttThread.recorder.bytes_written / 1024))
+
+#RTT回放
+rttReplay: Optional[RTTRecordingReader] = None
+
+def replay_open_callback(sender, app_data):
+    global rttReplay
+    path = dpg.get_value("rtt_replay_path")
+    if not os.path.exists(path):
+        print("Recording not found: ", path)
+        return
+    if rttReplay is not None:
+        rttReplay.close()
+    rttReplay = RTTRecordingReader(path)
+    replay_scroll_callback(None, None)
+
+def replay_file_callback(sender, app_data):
+    dpg.set_value("rtt_replay_path", app_data['file_path_name'])
+    replay_open_callback(sender, app_data)
+
+def replay_scroll_callback(sender, app_data):
+    if rttReplay is None:
+        return
+    rttReplay.reload()
+    lines = len(rttReplay)
+    dpg.configure_item("rtt_replay_scroll", max_value=max(lines - 1, 0))
+    start = dpg.get_value("rtt_replay_scroll")
+    dpg.set_value("rtt_replay_log", rttReplay.get_window(start, read_config_int("rtt_view_lines", 200)))
+    dpg.set_value("rtt_replay_status", "%d lines" % lines)
+
+def rtt_scroll_callback(sender, app_data, user_data):
+    dpg.set_value("rtt_log_follow", False)
+    rttThread.channels[user_data].view.refresh()
+
+def rtt_down_chan_callback(sender, app_data):
+    if app_data in rttThread.down_names:
+        rttThread.down_index = rttThread.down_names.index(app_data)
+
+def rtt_send_callback(sender, app_data):
+    text = dpg.get_value("rtt_input")
+    if text:
+        rttThread.send((text + "\n").encode("utf-8"))
+        dpg.set_value("rtt_input", "")
 
 def list_devices_callback(sender, app_data, user_data):
     print('OK was clicked.')
     print("Sender: ", sender)
     print("App Data: ", app_data)
     print("User Data: ", user_data)
-    allProbes = ConnectHelper.get_all_connected_probes(blocking=False)
-    list = []  
-    if len(allProbes):
-        #ConnectHelper._print_probe_list(allProbes)
-        for index, probe in enumerate(allProbes):
-            board_info = probe.associated_board_info
-            list.append(probe.description) 
-            print("probe.description",probe.description)
-        dpg.configure_item('links',items=list,default_value=list[0])
-    else:
-        print(colorama.Fore.RED + "No available debug probes are connected" + colorama.Style.RESET_ALL)
-    print(list)
-    
+    # enumeration happens on the watcher thread, update_links() applies the result
+    probeWatcher.refresh()
 
 
 
+#探针选择
+_probe_uids: Dict[str, str] = {}
+
+def probe_label(probe) -> str:
+    """@brief Combo label for a probe; the unique ID tells identical probes apart."""
+    label = "%s [%s]" % (probe.description, probe.unique_id)
+    _probe_uids[label] = probe.unique_id
+    return label
+
+def selected_probe_uid() -> Optional[str]:
+    return _probe_uids.get(dpg.get_value("links"))
+
+def links_callback(sender, app_data):
+    sessionManager.invalidate()
+
 def list_devices():
+    """@brief The watcher's cached probe labels; also asks it for a fresh scan in the background.
+
+    Never enumerates USB itself, so it is safe on the render thread. A newer list shows up through
+    update_links() once the scan finishes.
+    """
     print('list_devices was clicked.')
-    allProbes = ConnectHelper.get_all_connected_probes(blocking=False)
-    list = []  
-    if len(allProbes):
-        #ConnectHelper._print_probe_list(allProbes)
-        for index, probe in enumerate(allProbes):
-            board_info = probe.associated_board_info
-            list.append(probe.description) 
-            print("probe.description",probe.description)
-    else:
+    probeWatcher.refresh()
+    list = probeWatcher.labels
+    if not len(list):
         print(colorama.Fore.RED + "No available debug probes are connected" + colorama.Style.RESET_ALL)
     print(list)
     return list
 
-def erase_callback(sender, app_data):
-    print('OK was clicked.')
-    print("Sender: ", sender)
-    print("App Data: ", app_data)
-    pack_path = dpg.get_value("pack_path");
-    print("pack_path\n")
-    if len(pack_path)==0 :
-        pack_path = None
-    target_name = dpg.get_value("target_name");
-    if len(target_name)==0 :
-        target_name = None
+class ProbeWatcher:
+    """@brief Background probe discovery with hot-plug detection.
+
+    USB enumeration runs on the watcher thread every @a interval seconds, or sooner when
+    refresh() is called. The result is cached; @a version changes whenever a probe appears or
+    disappears, which the render thread uses to update the links combo. @a list_func returns the
+    connected probes and can be swapped out to run without hardware.
+    """
+    def __init__(self, interval: float = 2.0, list_func=None):
+        self.interval = interval
+        self.list_func = list_func or (lambda: ConnectHelper.get_all_connected_probes(blocking=False))
+        self.labels: List[str] = []
+        self.updated = 0.0
+        self.version = 0
+        self.scans = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="probe-watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+
+    def refresh(self) -> None:
+        """@brief Ask for a rescan without waiting for it."""
+        self._wake.set()
+
+    def probes(self, max_age: float = None) -> List[str]:
+        """@brief Cached probe labels; rescans synchronously if the cache is older than @a max_age."""
+        if max_age is not None and time.perf_counter() - self.updated > max_age:
+            self.scan()
+        return self.labels
+
+    def scan(self) -> None:
+        try:
+            labels = [probe_label(probe) for probe in self.list_func()]
+        except Exception as e:
+            LOG.warning("Probe enumeration failed: %s", e)
+            return
+        self.scans += 1
+        self.updated = time.perf_counter()
+        if labels != self.labels:
+            for label in set(labels) - set(self.labels):
+                LOG.info("Probe connected: %s", label)
+            for label in set(self.labels) - set(labels):
+                LOG.info("Probe disconnected: %s", label)
+            self.labels = labels
+            self.version += 1
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.scan()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+probeWatcher = ProbeWatcher()
+_links_version = -1
+
+def update_links() -> None:
+    """@brief Frame handler applying probe list changes to the links combo."""
+    global _links_version
+    if _links_version == probeWatcher.version:
+        return
+    _links_version = probeWatcher.version
+    labels = probeWatcher.labels
+    current = dpg.get_value("links")
+    if labels:
+        dpg.configure_item("links", items=labels)
+        if current not in labels:
+            dpg.set_value("links", labels[0])
+            sessionManager.invalidate()
+    else:
+        dpg.configure_item("links", items=[])
+        dpg.set_value("links", "No device found.")
+        sessionManager.invalidate()
+
+
+#性能面板
+class PerfCounters:
+    """@brief Always-on counters behind the performance panel.
+
+    The RTT capture loop (through RTTStats), flash jobs and session setup only add to plain
+    numbers. sample() runs on the render thread every @a interval seconds, turns the totals into
+    rates and keeps the last @a history samples of each series for the plots.
+    """
+    def __init__(self, interval: float = 0.5, history: int = 240):
+        self.interval = interval
+        self.history = history
+        self.start = time.perf_counter()
+        self.flash_bytes = 0
+        self._flash_base = 0
+        self._flash_total = 0
+        self.phases: Dict[str, float] = {}
+        self.times: collections.deque = collections.deque(maxlen=history)
+        self.series: Dict[str, collections.deque] = {}
+        self._totals: Dict[str, float] = {}
+        self._sample_time = None
+
+    def record_phase(self, name: str, seconds: float) -> None:
+        self.phases[name] = seconds
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_phase(name, time.perf_counter() - start)
+
+    def start_flash(self, total_bytes: int) -> None:
+        self._flash_base = self.flash_bytes
+        self._flash_total = total_bytes
+
+    def flash_progress(self, fraction: float) -> None:
+        self.flash_bytes = self._flash_base + int(fraction * self._flash_total)
+
+    def _delta(self, key: str, total: float) -> float:
+        last = self._totals.get(key, 0)
+        self._totals[key] = total
+        # a counter that went backwards was reset (e.g. RTT reconnected)
+        return total - last if total >= last else total
+
+    def _add(self, name: str, value: float) -> None:
+        series = self.series.get(name)
+        if series is None:
+            series = self.series[name] = collections.deque(maxlen=self.history)
+        series.append(value)
+
+    def sample(self, stats: RTTStats, channels: Dict[int, "RTTChannelState"]) -> bool:
+        """@brief Take a sample if @a interval has passed; True if one was taken."""
+        now = time.perf_counter()
+        if self._sample_time is not None and now - self._sample_time < self.interval:
+            return False
+        dt = max(now - self._sample_time if self._sample_time is not None else self.interval, 1e-3)
+        self._sample_time = now
+        self.times.append(now - self.start)
+        for index, state in list(channels.items()):
+            self._add("rtt_%d" % index, self._delta("rtt_%d" % index, state.captured_bytes) / 1024 / dt)
+        polls = self._delta("polls", stats.polls)
+        read_time = self._delta("read_time", stats.read_time)
+        transfers = self._delta("transfers", stats.transfers)
+        self._add("poll_ms", read_time / polls * 1000 if polls else 0.0)
+        self._add("transfers", transfers / polls if polls else 0.0)
+        self._add("flash_kbps", self._delta("flash", self.flash_bytes) / 1024 / dt)
+        return True
+
+    def points(self, name: str) -> List[List[float]]:
+        values = list(self.series.get(name, ()))
+        times = list(self.times)[-len(values):] if values else []
+        return [times, values]
+
+    def phase_summary(self) -> str:
+        return "  ".join("%s %.2fs" % (name, self.phases[name])
+                         for name in ("connect", "erase", "program", "verify") if name in self.phases)
+
+perfCounters = PerfCounters()
+
+# target methods the RTT channels reach the memory through
+TRANSFER_METHODS = ("read8", "read16", "read32", "read_memory", "read_memory_block8", "read_memory_block32",
+                    "write8", "write16", "write32", "write_memory", "write_memory_block8", "write_memory_block32")
+
+def count_transfers(target, stats: RTTStats) -> None:
+    """@brief Count the RTT poll pass's memory accesses through @a target in @a stats.transfers.
+
+    Wraps the target object's access methods once per session. Only calls made from the thread in
+    @a stats.counting are counted, which viewer_loop sets around its read pass, so other users of
+    the session do not show up. A block access counts as one transaction even if the probe splits it,
+    and only the outermost call is counted, since pyOCD implements read32() and friends on top of
+    read_memory().
+    """
+    if getattr(target, "_transfer_stats", None) is not None:
+        target._transfer_stats = stats
+        return
+    target._transfer_stats = stats
+    depth = threading.local()
+    for name in TRANSFER_METHODS:
+        method = getattr(target, name, None)
+        if method is None:
+            continue
+
+        def counted(*args, _method=method, **kwargs):
+            level = getattr(depth, "level", 0)
+            stats = target._transfer_stats
+            if level == 0 and stats.counting == threading.get_ident():
+                stats.transfers += 1
+            depth.level = level + 1
+            try:
+                return _method(*args, **kwargs)
+            finally:
+                depth.level = level
+        setattr(target, name, counted)
+
+def update_perf_view() -> None:
+    """@brief Frame handler sampling the counters and, while the panel is open, updating its plots."""
+    if not perfCounters.sample(rttThread.stats, rttThread.channels):
+        return
+    if not dpg.is_item_visible("perf_rtt_plot"):
+        return
+    for index, state in list(rttThread.channels.items()):
+        tag = "perf_rtt_%d" % index
+        if not dpg.does_item_exist(tag):
+            dpg.add_line_series([], [], label=state.label, parent="perf_rtt_y", tag=tag)
+        dpg.set_value(tag, perfCounters.points("rtt_%d" % index))
+    dpg.set_value("perf_poll_ms", perfCounters.points("poll_ms"))
+    dpg.set_value("perf_transfers", perfCounters.points("transfers"))
+    dpg.set_value("perf_flash_kbps", perfCounters.points("flash_kbps"))
+    for axis in ("perf_rtt_x", "perf_rtt_y", "perf_poll_x", "perf_poll_y", "perf_flash_x", "perf_flash_y"):
+        dpg.fit_axis_data(axis)
+    dpg.set_value("perf_phases", perfCounters.phase_summary())
+
+def add_perf_widgets() -> None:
+    dpg.add_text(tag="perf_phases", default_value="")
+    with dpg.plot(tag="perf_rtt_plot", label="RTT KB/s", height=180, width=-1):
+        dpg.add_plot_legend()
+        dpg.add_plot_axis(dpg.mvXAxis, label="s", tag="perf_rtt_x")
+        dpg.add_plot_axis(dpg.mvYAxis, label="KB/s", tag="perf_rtt_y")
+    with dpg.plot(label="RTT 轮询", height=180, width=-1):
+        dpg.add_plot_legend()
+        dpg.add_plot_axis(dpg.mvXAxis, label="s", tag="perf_poll_x")
+        with dpg.plot_axis(dpg.mvYAxis, tag="perf_poll_y"):
+            dpg.add_line_series([], [], label="读取耗时 ms", tag="perf_poll_ms")
+            dpg.add_line_series([], [], label="SWD 传输/轮询", tag="perf_transfers")
+    with dpg.plot(label="烧录 KB/s", height=180, width=-1):
+        dpg.add_plot_axis(dpg.mvXAxis, label="s", tag="perf_flash_x")
+        with dpg.plot_axis(dpg.mvYAxis, label="KB/s", tag="perf_flash_y"):
+            dpg.add_line_series([], [], label="烧录", tag="perf_flash_kbps")
+
+
+#变量监视
+WATCH_TYPES = {"u8": "B", "i8": "b", "u16": "H", "i16": "h", "u32": "I", "i32": "i", "f32": "f", "float": "f"}
+
+class WatchEntry:
+    """@brief One watched variable: NAME TYPE[COUNT] [ADDRESS] [plot].
+
+    ADDRESS is a number or an ELF symbol; without it NAME is looked up as a symbol. Values are
+    little-endian. Scalars marked "plot" keep a history for the watch plot.
+    """
+    def __init__(self, text: str):
+        words = text.split()
+        plot = bool(words) and words[-1] == "plot"
+        if plot:
+            words.pop()
+        m = re.fullmatch(r'(\w+)(?:\[(\d+)\])?', words[1]) if len(words) in (2, 3) else None
+        if m is None or m.group(1) not in WATCH_TYPES:
+            raise ValueError("bad watch entry '%s', expected NAME TYPE[COUNT] [ADDRESS] [plot], TYPE one of %s"
+                             % (text, ", ".join(WATCH_TYPES)))
+        self.text = text.strip()
+        self.name = words[0]
+        self.kind = m.group(1)
+        self.count = int(m.group(2) or 1)
+        self.format = "<%d%s" % (self.count, WATCH_TYPES[self.kind])
+        self.size = struct.calcsize(self.format)
+        self.symbol = words[2] if len(words) == 3 else words[0]
+        self.address: Optional[int] = None
+        self.plot = plot and self.count == 1
+        self.value = None
+        self.error = ""
+        self.history: collections.deque = collections.deque(maxlen=read_config_int("watch_history", 600))
+        if len(words) == 3 and re.fullmatch(r'0[xX][0-9a-fA-F]+|\d+', words[2]):
+            self.address = int(words[2], 0)
+
+    def update(self, data: bytes, now: float) -> None:
+        values = struct.unpack(self.format, data)
+        self.value = values[0] if self.count == 1 else values
+        if self.plot:
+            self.history.append((now, self.value))
+
+    def value_text(self) -> str:
+        if self.value is None:
+            return self.error
+        values = self.value if self.count > 1 else (self.value,)
+        return ", ".join("%g" % v if isinstance(v, float) else str(v) for v in values)
+
+def plan_watch_reads(entries: Iterable[WatchEntry], gap: int = 32, max_block: int = 1024,
+                     ram: Sequence[Tuple[int, int]] = ()) -> List[Tuple[int, int, List[WatchEntry]]]:
+    """@brief Sort @a entries by address and coalesce them into as few block reads as possible.
+
+    Overlapping or touching entries share a read, and entries up to @a gap bytes apart are merged
+    only inside one of the @a ram (start, end) ranges, so unwatched peripheral registers in between
+    are never read. A block grows to at most @a max_block bytes: an entry that would take it past
+    that starts a new block at its own address, so every entry lies wholly inside one block. A
+    single entry larger than @a max_block gets a block of its own size, which also takes in the
+    entries it covers. Returns (address, size, entries) per read.
+    """
+    def in_ram(start, end):
+        return any(low <= start and end <= high for low, high in ram)
+
+    blocks: List[Tuple[int, int, List[WatchEntry]]] = []
+    for entry in sorted((e for e in entries if e.address is not None), key=lambda e: e.address):
+        end = entry.address + entry.size
+        if blocks:
+            start, size, members = blocks[-1]
+            stop = start + size
+            if end <= stop or (end - start <= max_block and
+                               (entry.address <= stop or (entry.address - stop <= gap and in_ram(start, end)))):
+                blocks[-1] = (start, max(stop, end) - start, members + [entry])
+                continue
+        blocks.append((entry.address, entry.size, [entry]))
+    return blocks
+
+class MemoryWatcher:
+    """@brief Polls the watch list on the session manager's session while the target runs.
+
+    Runs on its own thread next to the RTT capture thread and shares its session. The lock is
+    taken per block read rather than per pass, so an RTT poll waits for at most one block; the
+    read plan is rebuilt only when the list changes.
+    """
+    def __init__(self):
+        self.entries: List[WatchEntry] = []
+        self.list_version = 0       # bumped when entries are added or removed
+        self.version = 0            # bumped after every pass
+        self.rate = read_config_float("watch_rate_hz", 10)
+        self.elf_path = None
+        self.unique_id = None
+        self.pack_path = None
+        self.target_name = None
+        self.alive = threading.Event()
+        self.thread = None
+        self.passes = 0
+        self.reads = 0
+        self.read_time = 0.0        # duration of the last pass
+        self.plan: List[Tuple[int, int, List[WatchEntry]]] = []
+        for text in read_config("watch_list").split(';'):
+            if text.strip():
+                try:
+                    self.entries.append(WatchEntry(text))
+                except ValueError as e:
+                    LOG.warning("%s", e)
+
+    def save(self) -> None:
+        save_config("watch_list", ";".join(entry.text for entry in self.entries))
+
+    def add(self, text: str) -> WatchEntry:
+        entry = WatchEntry(text)
+        self.entries = self.entries + [entry]
+        self.resolve()
+        self.save()
+        return entry
+
+    def remove(self, entry: WatchEntry) -> None:
+        self.entries = [e for e in self.entries if e is not entry]
+        self.list_version += 1
+        self.save()
+
+    def resolve(self) -> None:
+        """@brief Look up the addresses of symbol entries in @a elf_path."""
+        entries = self.entries
+        symbols = elf_symbol_addresses(self.elf_path, (e.symbol for e in entries if e.address is None))
+        for entry in entries:
+            if entry.address is None:
+                entry.address = symbols.get(entry.symbol)
+                entry.error = "" if entry.address is not None else "符号未找到"
+        self.list_version += 1
+
+    def start(self) -> None:
+        if self.thread is not None:
+            return
+        self.resolve()
+        self.alive.set()
+        self.thread = threading.Thread(target=self._run, name="memory-watch", daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        if self.thread is not None:
+            self.alive.clear()
+            self.thread.join()
+            self.thread = None
+
+    def poll(self, target, lock) -> None:
+        """@brief Read every block of the plan once and decode the entries in it."""
+        start = time.perf_counter()
+        for address, size, members in self.plan:
+            with lock:
+                data = bytes(target.read_memory_block8(address, size))
+            now = time.perf_counter()
+            for entry in members:
+                entry.update(data[entry.address - address:entry.address - address + entry.size], now)
+        self.reads += len(self.plan)
+        self.passes += 1
+        self.read_time = time.perf_counter() - start
+        self.version += 1
+
+    def _run(self) -> None:
+        manager = sessionManager
+        planned = None
+        target = None
+        next_time = time.perf_counter()
+        while self.alive.is_set():
+            try:
+                if target is None:
+                    with manager.lock:
+                        target = manager.get(self.unique_id, self.pack_path, self.target_name).board.target
+                        ram = [(region.start, region.start + region.length)
+                               for region in target.memory_map.get_regions_of_type(MemoryType.RAM)]
+                    planned = None
+                if planned != self.list_version:
+                    planned = self.list_version
+                    self.plan = plan_watch_reads(self.entries, read_config_int("watch_merge_gap", 32),
+                                                 read_config_int("watch_max_block", 1024), ram)
+                self.poll(target, manager.lock)
+            except Exception as e:
+                LOG.warning("Memory watch read failed: %s", e)
+                target = None
+                next_time = time.perf_counter() + 1.0
+            # fixed rate, but never closer together than the pass itself takes
+            next_time = max(next_time + 1 / max(self.rate, 0.1), time.perf_counter() + self.read_time)
+            sleep(max(0.0, next_time - time.perf_counter()))
+
+    def summary(self) -> str:
+        watched = sum(1 for entry in self.entries if entry.address is not None)
+        return "%d 个变量, 每次 %d 次读取, %.1f ms" % (watched, len(self.plan), self.read_time * 1000)
+
+memoryWatcher = MemoryWatcher()
+
+def watch_add_callback(sender, app_data):
+    text = dpg.get_value("watch_entry")
+    try:
+        memoryWatcher.add(text)
+    except ValueError as e:
+        dpg.set_value("watch_status", str(e))
+        return
+    dpg.set_value("watch_entry", "")
+
+def watch_remove_callback(sender, app_data, user_data):
+    memoryWatcher.remove(user_data)
+
+def watch_start_callback(sender, app_data):
+    watcher = memoryWatcher
+    # widgets are only read here on the render thread, like RTTThread.Connect
+    watcher.unique_id = selected_probe_uid()
+    watcher.pack_path = dpg.get_value("pack_path") or None
+    watcher.target_name = dpg.get_value("target_name") or None
+    watcher.elf_path = read_config("rtt_elf") or dpg.get_value("bin_path") or None
+    watcher.start()
+
+def watch_stop_callback(sender, app_data):
+    memoryWatcher.stop()
+
+def watch_rate_callback(sender, app_data):
+    memoryWatcher.rate = max(0.1, app_data)
+    save_config("watch_rate_hz", str(memoryWatcher.rate))
+
+_watch_shown = (None, None)
+
+def update_watch_view() -> None:
+    """@brief Frame handler: rebuilds the watch table when the list changes, else updates values."""
+    global _watch_shown
+    watcher = memoryWatcher
+    if not dpg.does_item_exist("watch_table") or _watch_shown == (watcher.list_version, watcher.version):
+        return
+    if _watch_shown[0] != watcher.list_version:
+        dpg.delete_item("watch_table", children_only=True, slot=1)
+        dpg.delete_item("watch_y", children_only=True)
+        for index, entry in enumerate(watcher.entries):
+            with dpg.table_row(parent="watch_table"):
+                dpg.add_text(entry.name)
+                dpg.add_text("%s[%d]" % (entry.kind, entry.count) if entry.count > 1 else entry.kind)
+                dpg.add_text("0x%08x" % entry.address if entry.address is not None else entry.symbol)
+                dpg.add_text(entry.value_text(), tag="watch_value_%d" % index)
+                dpg.add_button(label="删除", callback=watch_remove_callback, user_data=entry)
+            if entry.plot:
+                dpg.add_line_series([], [], label=entry.name, parent="watch_y", tag="watch_series_%d" % index)
+    _watch_shown = (watcher.list_version, watcher.version)
+    for index, entry in enumerate(watcher.entries):
+        if dpg.does_item_exist("watch_value_%d" % index):
+            dpg.set_value("watch_value_%d" % index, entry.value_text())
+    if dpg.is_item_visible("watch_plot"):
+        start = perfCounters.start
+        for index, entry in enumerate(watcher.entries):
+            if entry.plot and entry.history and dpg.does_item_exist("watch_series_%d" % index):
+                history = list(entry.history)
+                dpg.set_value("watch_series_%d" % index, [[t - start for t, _ in history], [v for _, v in history]])
+        dpg.fit_axis_data("watch_x")
+        dpg.fit_axis_data("watch_y")
+    dpg.set_value("watch_status", watcher.summary())
+
+def add_watch_widgets() -> None:
+    with dpg.group(horizontal=True):
+        dpg.add_input_text(tag="watch_entry", width=400, hint="名称 类型[数量] [地址|符号] [plot]",
+                           on_enter=True, callback=watch_add_callback)
+        dpg.add_button(label="添加", callback=watch_add_callback)
+        dpg.add_button(label="开始", callback=watch_start_callback)
+        dpg.add_button(label="停止", callback=watch_stop_callback)
+        dpg.add_input_float(tag="watch_rate", label="Hz", width=100, default_value=memoryWatcher.rate,
+                            min_value=0.1, min_clamped=True, on_enter=True, callback=watch_rate_callback)
+        dpg.add_text(tag="watch_status", default_value="")
+    with dpg.table(tag="watch_table", header_row=True, row_background=True, borders_innerH=True, height=200):
+        dpg.add_table_column(label="名称")
+        dpg.add_table_column(label="类型")
+        dpg.add_table_column(label="地址")
+        dpg.add_table_column(label="值", width_stretch=True)
+        dpg.add_table_column(label="")
+    with dpg.plot(tag="watch_plot", height=180, width=-1):
+        dpg.add_plot_legend()
+        dpg.add_plot_axis(dpg.mvXAxis, label="s", tag="watch_x")
+        dpg.add_plot_axis(dpg.mvYAxis, tag="watch_y")
+
+
+#SWD时钟
+SWD_FREQUENCIES = [100000, 500000, 1000000, 2000000, 4000000, 8000000, 10000000, 12000000, 16000000, 24000000, 50000000]
+SWD_DEFAULT_FREQUENCY = 4000000
+SWD_AUTO = "自动"
+
+def frequency_label(frequency: int) -> str:
+    return "%g MHz" % (frequency / 1e6)
+
+def tuned_frequency_key(unique_id: Optional[str], target_name: Optional[str]) -> str:
+    return "%s|%s" % (unique_id or "", target_name or "")
+
+def session_frequency(unique_id: Optional[str], target_name: Optional[str]) -> int:
+    """@brief SWD clock for a probe/target pair: the configured value, or the auto-tuned one in auto mode.
+
+    With no probe selected pyOCD picks the only connected one, so its tuned clock is used when the
+    probe watcher sees exactly one; otherwise the clock tuned last for @a target_name on any probe.
+    """
+    setting = read_config("swd_frequency")
+    if setting and setting != SWD_AUTO:
+        try:
+            return int(setting)
+        except ValueError:
+            LOG.warning("invalid swd_frequency '%s'", setting)
+    if unique_id is None:
+        connected = [_probe_uids.get(label) for label in probeWatcher.labels]
+        if len(connected) == 1:
+            unique_id = connected[0]
+    tuned = read_config(tuned_frequency_key(unique_id, target_name), section="swd_tuned")
+    if not tuned.isdigit():
+        tuned = read_config(tuned_frequency_key(None, target_name), section="swd_tuned")
+    return int(tuned) if tuned.isdigit() else SWD_DEFAULT_FREQUENCY
+
+def session_options(unique_id: Optional[str], target_name: Optional[str]) -> Dict[str, Any]:
+    return {"frequency": session_frequency(unique_id, target_name), "target_override": target_name}
+
+def swd_link_test(target, address: int, size: int, rounds: int) -> bool:
+    """@brief Write and read back test patterns in target RAM; True if every round matched."""
+    patterns = [bytes([0x55]) * size, bytes([0xaa]) * size, bytes(i & 0xff for i in range(size))]
+    for _ in range(rounds):
+        patterns.append(os.urandom(size))
+        for pattern in patterns:
+            target.write_memory_block8(address, pattern)
+            if bytes(target.read_memory_block8(address, size)) != pattern:
+                return False
+        target.read32(SessionManager.HEALTH_CHECK_ADDRESS)
+    return True
+
+def swd_autotune_job(job: Job, unique_id: Optional[str], pack_path: Optional[str], target_name: Optional[str]):
+    """@brief Step the SWD clock up until RAM pattern tests fail and store the highest good value.
+
+    The target is halted and the RAM used for the test is restored afterwards. The result is
+    saved per probe/target pair, and per target, in the [swd_tuned] section of config.ini.
+    """
+    sessionManager.close()
     session = ConnectHelper.session_with_chosen_probe(
-                        project_dir=None,
-                        config_file=None,
-                        user_script=None,
-                        no_config=None,
-                        pack=pack_path, 
-                        unique_id=None,
-                        blocking=(not None),
-                        connect_mode=None,
-                        options = {"frequency": 4000000, "target_override": target_name},
-                        option_defaults=None,
+                        pack=pack_path,
+                        unique_id=unique_id,
+                        blocking=False,
+                        options = {"frequency": SWD_FREQUENCIES[0], "target_override": target_name},
                         )
     if session is None:
-        LOG.error("No device available to erase")
-        return 1
+        raise RuntimeError("No target device available")
+    rounds = read_config_int("swd_tune_rounds", 3)
+    best = None
     with session:
+        target = session.target
+        region = target.memory_map.get_default_region_of_type(MemoryType.RAM)
+        if region is None:
+            raise RuntimeError("Target has no RAM region to test with")
+        size = min(1024, region.length)
+        target.halt()
+        saved = bytes(target.read_memory_block8(region.start, size))
+        try:
+            for step, frequency in enumerate(SWD_FREQUENCIES):
+                job.set_progress(step / len(SWD_FREQUENCIES))
+                try:
+                    session.probe.set_clock(frequency)
+                    ok = swd_link_test(target, region.start, size, rounds)
+                except Exception as e:
+                    LOG.info("SWD test at %s failed: %s", frequency_label(frequency), e)
+                    ok = False
+                if not ok:
+                    break
+                best = frequency
+        finally:
+            # go back to a known good clock before restoring the RAM contents
+            session.probe.set_clock(best or SWD_FREQUENCIES[0])
+            target.write_memory_block8(region.start, saved)
+            target.resume()
+        uid = session.probe.unique_id
+    if best is None:
+        raise RuntimeError("SWD link unreliable even at %s" % frequency_label(SWD_FREQUENCIES[0]))
+    save_config(tuned_frequency_key(uid, target_name), str(best), section="swd_tuned")
+    # fallback for runs that do not name a probe
+    save_config(tuned_frequency_key(None, target_name), str(best), section="swd_tuned")
+    job.message = "%s: %s" % (uid, frequency_label(best))
+    return best
+
+def swd_frequency_callback(sender, app_data):
+    if app_data == SWD_AUTO:
+        save_config("swd_frequency", SWD_AUTO)
+    else:
+        for frequency in SWD_FREQUENCIES:
+            if frequency_label(frequency) == app_data:
+                save_config("swd_frequency", str(frequency))
+    sessionManager.invalidate()
+
+def swd_autotune_callback(sender, app_data):
+    rttThread.DisConnect()
+    jobExecutor.submit("SWD调速", swd_autotune_job, selected_probe_uid(),
+                       dpg.get_value("pack_path") or None, dpg.get_value("target_name") or None)
+
+def swd_frequency_setting_label() -> str:
+    setting = read_config("swd_frequency")
+    if not setting or setting == SWD_AUTO:
+        return SWD_AUTO
+    return frequency_label(int(setting)) if setting.isdigit() else SWD_AUTO
+
+def erase_job(job: Job, unique_id: Optional[str], pack_path: Optional[str], target_name: Optional[str]):
+    with sessionManager.acquire(unique_id, pack_path, target_name) as session:
+        job.check_cancelled()
         #mode = self._args.erase_mode or FlashEraser.Mode.SECTOR
         eraser = FlashEraser(session, FlashEraser.Mode.CHIP)
 
         #addresses = flatten_args(self._args.addresses)
-        eraser.erase(None)
-    dpg.set_value("flash_progress_bar", 1)
+        with perfCounters.phase("erase"):
+            eraser.erase(None)
+        DeltaFlashCache(session.probe.unique_id, target_name).invalidate()
+    job.set_progress(1.0)
+
+def program_job(job: Job, unique_id: Optional[str], pack_path: Optional[str], target_name: Optional[str], filename: str,
+                verify: bool = False):
+    # parse the image (or fetch it from the image cache) while the session connects
+    prepared = imageCache.prepare(filename, flash_sector_guess(target_name))
+
+    with sessionManager.acquire(unique_id, pack_path, target_name) as session:
+        job.check_cancelled()
+        image = prepared.result()
+        LOG.info("Loading %s (%d bytes in %d segments)", filename, image.size, len(image.segments))
+
+        def progress(fraction):
+            perfCounters.flash_progress(fraction)
+            job.set_progress(fraction)
+
+        # the old record stops describing the flash as soon as the first sector is erased
+        cache = DeltaFlashCache(session.probe.unique_id, target_name)
+        cache.invalidate()
+        perfCounters.start_flash(image.size)
+        with perfCounters.phase("program"):
+            loader = FlashLoader(session, progress=progress)
+            for address, data in image.segments:
+                loader.add_data(address, data)
+            loader.commit()
+
+        if verify:
+            sector_size, erased = flash_sector_layout(session, image.start)
+            result = verify_image(session, image.sectors(sector_size, erased), job.set_progress)
+            job.message = verify_summary(result)
+            if result["failed"]:
+                raise RuntimeError("verify failed: %s" % job.message)
+        # remember what a full program wrote so the next delta flash has a baseline
+        cache.record(session, image, target_name)
+
+def delta_program_job(job: Job, unique_id: Optional[str], pack_path: Optional[str], target_name: Optional[str],
+                      filename: str, verify: bool):
+    prepared = imageCache.prepare(filename, flash_sector_guess(target_name))
+    with sessionManager.acquire(unique_id, pack_path, target_name) as session:
+        job.check_cancelled()
+        image = prepared.result()
+        cache = DeltaFlashCache(session.probe.unique_id, target_name)
+        with perfCounters.phase("program"):
+            result = delta_program(session, image, cache, job.set_progress, verify)
+        remember_flash_sector(target_name, result["sector_size"])
+    job.message = delta_summary(result)
+    LOG.info("Delta flash %s: %s", os.path.basename(filename), job.message)
+    return result
+
+FLASH_BASE_ADDRESS = 0x8000000
+
+def flash_sector_layout(session, base_address: int) -> Tuple[int, int]:
+    """@brief Sector size and erased byte value of the flash region containing @a base_address."""
+    region = session.target.memory_map.get_region_for_address(base_address)
+    if region is None or not region.is_flash:
+        raise RuntimeError("No flash region at %#010x" % base_address)
+    sector_size = getattr(region, "sector_size", None) or region.blocksize
+    return sector_size, getattr(region, "erased_byte_value", 0xff)
+
+def flash_sector_guess(target_name: Optional[str]) -> Optional[int]:
+    """@brief Sector size seen on @a target_name last time, so images can be split before connecting."""
+    value = read_config(target_name or "default", section="flash_sectors")
+    return int(value) if value.isdigit() else None
+
+def remember_flash_sector(target_name: Optional[str], sector_size: int) -> None:
+    if flash_sector_guess(target_name) != sector_size:
+        save_config(target_name or "default", str(sector_size), section="flash_sectors")
+
+
+#镜像准备
+IntelHex = _LazyImport("intelhex", "IntelHex")
+ELFFile = _LazyImport("elftools.elf.elffile", "ELFFile")
+
+# The part of an image inside one flash sector: the sector's start address, the bytes to program
+# in it and where they start, their CRC32, and the SHA-1 of the whole sector with the rest filled
+# with the erased value (what delta flashing compares).
+ImageSector = collections.namedtuple("ImageSector", "sector address data crc sha1")
+
+class FlashImage:
+    """@brief A firmware image as sorted (address, data) segments, independent of the file format.
+
+    sectors() cuts the segments at sector boundaries and digests each piece; the split is kept per
+    sector size, so program, delta flash and verify share one pass over the image.
+    """
+    def __init__(self, key: str, segments: Iterable[Tuple[int, bytes]]):
+        self.key = key
+        self.segments: List[Tuple[int, bytes]] = sorted((address, bytes(data)) for address, data in segments if data)
+        self._sectors: Dict[Tuple[int, int], List[ImageSector]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_bin(cls, data: bytes, base: int = FLASH_BASE_ADDRESS, key: str = None) -> "FlashImage":
+        return cls(key or hashlib.sha1(data).hexdigest(), [(base, data)])
+
+    @property
+    def start(self) -> int:
+        return self.segments[0][0] if self.segments else FLASH_BASE_ADDRESS
+
+    @property
+    def size(self) -> int:
+        return sum(len(data) for _, data in self.segments)
+
+    def sectors(self, sector_size: int, erased: int = 0xff, map_func=map) -> List[ImageSector]:
+        """@brief The image split into per-sector pieces, with digests.
+
+        Gaps between segments that fall inside one sector are filled with @a erased. @a map_func
+        is used for the digests, so a thread pool's map can spread them over several cores.
+        """
+        with self._lock:
+            cached = self._sectors.get((sector_size, erased))
+            if cached is not None:
+                return cached
+            pieces: Dict[int, List[Tuple[int, bytes]]] = {}
+            for address, data in self.segments:
+                offset = 0
+                while offset < len(data):
+                    start = address + offset
+                    sector = start - start % sector_size
+                    count = min(len(data) - offset, sector + sector_size - start)
+                    pieces.setdefault(sector, []).append((start, data[offset:offset + count]))
+                    offset += count
+            fill = bytes([erased])
+
+            def digest(sector: int) -> ImageSector:
+                parts = pieces[sector]
+                start = parts[0][0]
+                end = max(address + len(data) for address, data in parts)
+                if len(parts) == 1:
+                    data = parts[0][1]
+                else:
+                    buf = bytearray(fill * (end - start))
+                    for address, part in parts:
+                        buf[address - start:address - start + len(part)] = part
+                    data = bytes(buf)
+                padded = fill * (start - sector) + data + fill * (sector + sector_size - end)
+                return ImageSector(sector, start, data, zlib.crc32(data), hashlib.sha1(padded).hexdigest())
 
+            result = list(map_func(digest, sorted(pieces)))
+            self._sectors[(sector_size, erased)] = result
+            return result
 
-def load_callback(sender, app_data):
-    print('OK was clicked.')
-    print("Sender: ", sender)
-    print("App Data: ", app_data)
-    pack_path = dpg.get_value("pack_path");
-    print(pack_path)
-    if len(pack_path)==0 :
-        pack_path = None
-    target_name = dpg.get_value("target_name");
-    if len(target_name)==0 :
-        target_name = None
-    print(target_name)
-    session = ConnectHelper.session_with_chosen_probe(
-                        project_dir=None,
-                        config_file=None,
-                        user_script=None,
-                        no_config=None,
-                        pack=pack_path, 
-                        unique_id=None,
-                        blocking=(not None),
-                        connect_mode=None,
-                        options = {"frequency": 4000000, "target_override": target_name},
-                        option_defaults=None,
-                        )
-    with session:
-        programmer = FileProgrammer(session,progress=print_progress,
-                        chip_erase=None,
-                        no_reset=None)
-        filename = dpg.get_value("bin_path");
-        if len(filename)==0 :
-            print('Bin path is NULL.')
+
+class ImageCache:
+    """@brief Parses bin/hex/ELF files once and keeps the result keyed by file content.
+
+    The parsed segments are stored in cache/images as <sha1>.bin (the segment data back to back)
+    plus <sha1>.json (the segment table), so a HEX or ELF file is only parsed again when its
+    content changes. prepare() does the loading and the per-sector digests on a small thread pool,
+    which lets it overlap with connecting to the target.
+
+    Only the @a memo_size most recently used images stay in memory, and the files on disk are
+    trimmed to @a max_bytes, least recently used first.
+    """
+    FORMAT = 1
+
+    def __init__(self, directory: str = None, workers: int = 2, memo_size: int = 4, max_bytes: int = 256 << 20):
+        self._directory = directory
+        self.memo_size = max(1, memo_size)
+        self.max_bytes = max_bytes
+        self._memo: collections.OrderedDict = collections.OrderedDict()
+        self._pending: Dict[Tuple, concurrent.futures.Future] = {}
+        self._lock = threading.Lock()
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image")
+        # the digests of a large image are spread over their own pool: _prepare() runs on _pool
+        # and waits for them, so giving them to _pool could leave every worker waiting
+        self._digest_pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-digest")
+
+    @property
+    def directory(self) -> str:
+        if self._directory is None:
+            self._directory = cache_dir("images")
+        return self._directory
+
+    @staticmethod
+    def parse(path: str, base: int = FLASH_BASE_ADDRESS) -> List[Tuple[int, bytes]]:
+        """@brief Segments of a .bin (placed at @a base), .hex or ELF (.elf/.axf/.out) file."""
+        suffix = Path(path).suffix.lower()
+        if suffix in (".hex", ".ihex"):
+            ih = IntelHex(path)
+            return [(start, ih.tobinstr(start=start, end=end - 1)) for start, end in ih.segments()]
+        if suffix in (".elf", ".axf", ".out"):
+            with open(path, 'rb') as f:
+                elf = ELFFile(f)
+                # loadable segments at their load (physical) address, which is where initialised data lives in flash
+                return [(segment['p_paddr'], segment.data()) for segment in elf.iter_segments()
+                        if segment['p_type'] == 'PT_LOAD' and segment['p_filesz'] > 0]
+        with open(path, 'rb') as f:
+            return [(base, f.read())]
+
+    def load(self, path: str, base: int = FLASH_BASE_ADDRESS) -> FlashImage:
+        sha1 = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha1.update(block)
+        key = sha1.hexdigest()
+        if Path(path).suffix.lower() not in (".hex", ".ihex", ".elf", ".axf", ".out"):
+            key += "-%08x" % base      # a raw binary's layout depends on where it is placed
+        with self._lock:
+            image = self._memo.get(key)
+            if image is not None:
+                self._memo.move_to_end(key)
+                return image
+        image = self._read(key)
+        if image is None:
+            start = time.perf_counter()
+            image = FlashImage(key, self.parse(path, base))
+            self._write(image)
+            LOG.info("Parsed %s: %d bytes in %d segments, %.2fs", os.path.basename(path), image.size,
+                     len(image.segments), time.perf_counter() - start)
+        with self._lock:
+            image = self._memo.setdefault(key, image)
+            self._memo.move_to_end(key)
+            while len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+        return image
+
+    def _read(self, key: str) -> Optional[FlashImage]:
+        path = os.path.join(self.directory, key)
+        try:
+            with open(path + ".json", encoding="utf-8") as f:
+                record = json.load(f)
+            if record.get("format") != self.FORMAT:
+                return None
+            with open(path + ".bin", 'rb') as f:
+                blob = f.read()
+            os.utime(path + ".json")       # the mtime orders eviction in _trim()
+        except (OSError, ValueError):
+            return None
+        segments = []
+        offset = 0
+        for address, length in record["segments"]:
+            segments.append((address, blob[offset:offset + length]))
+            offset += length
+        return FlashImage(key, segments) if offset == len(blob) else None
+
+    def _write(self, image: FlashImage) -> None:
+        path = os.path.join(self.directory, image.key)
+        try:
+            with open(path + ".bin.tmp", 'wb') as f:
+                for _, data in image.segments:
+                    f.write(data)
+            os.replace(path + ".bin.tmp", path + ".bin")
+            with open(path + ".json.tmp", 'w', encoding="utf-8") as f:
+                json.dump({"format": self.FORMAT, "segments": [[address, len(data)] for address, data in image.segments]}, f)
+            os.replace(path + ".json.tmp", path + ".json")
+        except OSError as e:
+            LOG.warning("Caching image %s failed: %s", image.key, e)
             return
-        # Get an initial path with the argument as-is.
-        file_path = Path(filename).expanduser()
+        self._trim(keep=image.key)
 
-        # Look for a base address suffix. If the supplied argument including an address suffix
-        # references an existing file, then the address suffix is not extracted.
-        base_address = None
+    def _trim(self, keep: str) -> None:
+        """@brief Delete the least recently used images until the cache fits in max_bytes."""
+        entries = {}
+        try:
+            for entry in os.scandir(self.directory):
+                key, _, suffix = entry.name.partition(".")
+                if suffix not in ("bin", "json") or key == keep:
+                    continue
+                st = entry.stat()
+                used, size = entries.get(key, (0.0, 0))
+                entries[key] = (max(used, st.st_mtime), size + st.st_size)
+        except OSError:
+            return
+        keep_path = os.path.join(self.directory, keep)
+        total = sum(size for _, size in entries.values())
+        total += sum(os.path.getsize(keep_path + suffix) for suffix in (".bin", ".json") if os.path.exists(keep_path + suffix))
+        for key, (_, size) in sorted(entries.items(), key=lambda item: item[1][0]):
+            if total <= self.max_bytes:
+                break
+            for suffix in (".bin", ".json"):
+                try:
+                    os.remove(os.path.join(self.directory, key + suffix))
+                except OSError:
+                    pass
+            total -= size
+            LOG.info("Dropped cached image %s", key)
+
+    def _prepare(self, path: str, base: int, sector_size: Optional[int]) -> FlashImage:
+        image = self.load(path, base)
+        if sector_size:
+            image.sectors(sector_size, map_func=self._digest_pool.map if image.size >= 256 * 1024 else map)
+        return image
+
+    def prepare(self, filename: str, sector_size: Optional[int] = None,
+                base: int = FLASH_BASE_ADDRESS) -> concurrent.futures.Future:
+        """@brief Start loading @a filename, and its digests for @a sector_size, in the background.
+
+        Returns a Future of the FlashImage. Asking again for an unchanged file while it is being
+        prepared returns the same Future; once it is done the image is found in the memo.
+        """
+        path = str(Path(filename).expanduser().resolve())
+        st = os.stat(path)
+        key = (path, st.st_mtime, st.st_size, sector_size, base)
+        with self._lock:
+            future = self._pending.get(key)
+            if future is not None:
+                return future
+            future = self._pool.submit(self._prepare, path, base, sector_size)
+            self._pending[key] = future
+        # outside the lock: the callback runs right here if the future is already done
+        future.add_done_callback(lambda done: self._forget(key, done))
+        return future
+
+    def _forget(self, key: Tuple, future: concurrent.futures.Future) -> None:
+        with self._lock:
+            if self._pending.get(key) is future:
+                del self._pending[key]
+
+imageCache = ImageCache(memo_size=read_config_int("image_cache_memo", 4),
+                        max_bytes=read_config_int("image_cache_max_mb", 256) << 20)
+
+
+#差分烧录
+class DeltaFlashCache:
+    """@brief Host-side record of the last image programmed through one probe to one target.
+
+    Only the per-sector hashes (by sector address) are needed to work out what changed, plus the
+    image cache key of what was written. Erasing the chip drops the record.
+    """
+    FORMAT = 2
 
-        # Resolve our path.
-        file_path = Path(filename).expanduser().resolve()
-        filename = str(file_path)
+    def __init__(self, unique_id: Optional[str], target_name: Optional[str]):
+        key = re.sub(r'[^\w.-]', '_', "%s_%s" % (unique_id or "default", target_name or "default"))
+        self.path = os.path.join(cache_dir("delta"), key)
+        self.sector_size = None
+        self.sectors: Dict[int, str] = {}
+        self.image = None
+        self.rate = 0.0         # bytes/s measured on the last delta flash that wrote anything
 
-        if base_address is None:
-            LOG.info("Loading %s", filename)
+    def load(self) -> bool:
+        try:
+            with open(self.path + ".json", encoding="utf-8") as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if record.get("format") != self.FORMAT:
+            return False
+        self.sector_size = record["sector_size"]
+        self.sectors = {int(sector): sha1 for sector, sha1 in record["sectors"].items()}
+        self.image = record.get("image")
+        self.rate = record.get("rate", 0.0)
+        return True
+
+    def save(self, sector_size: int, sectors: Dict[int, str], image: str) -> None:
+        self.sector_size, self.sectors, self.image = sector_size, sectors, image
+        with open(self.path + ".json", 'w', encoding="utf-8") as f:
+            json.dump({"format": self.FORMAT, "sector_size": sector_size, "image": image, "rate": self.rate,
+                       "sectors": {str(sector): sha1 for sector, sha1 in sectors.items()}}, f)
+
+    def record(self, session, image: FlashImage, target_name: Optional[str] = None) -> None:
+        sector_size, erased = flash_sector_layout(session, image.start)
+        remember_flash_sector(target_name, sector_size)
+        self.save(sector_size, {s.sector: s.sha1 for s in image.sectors(sector_size, erased)}, image.key)
+
+    def invalidate(self) -> None:
+        if os.path.exists(self.path + ".json"):
+            os.remove(self.path + ".json")
+
+
+def delta_program(session, image: FlashImage, cache: DeltaFlashCache, progress=None,
+                  verify: bool = True, loader_class=None) -> Dict[str, Any]:
+    """@brief Program only the sectors of @a image that differ from the cached last image.
+
+    Changed sectors are merged into contiguous runs, sector-erased and programmed with
+    FlashLoader (or @a loader_class, which takes the same arguments). With @a verify the
+    programmed sectors are checked with verify_image() afterwards.
+
+    The record is only a hint: the sectors it would skip are first checked against the flash
+    with verify_image(), and if any of them differs (another tool or device was used since) the
+    whole image is programmed. The record is dropped before the first erase and saved again only
+    once programming and verify have succeeded.
+    """
+    sector_size, erased = flash_sector_layout(session, image.start)
+    sectors = image.sectors(sector_size, erased)
+    cached = cache.sectors if cache.load() and cache.sector_size == sector_size else {}
+    changed = [s for s in sectors if cached.get(s.sector) != s.sha1]
+    if len(changed) != len(sectors):
+        skipped = [s for s in sectors if cached.get(s.sector) == s.sha1]
+        stale = verify_image(session, skipped)["failed"]
+        if stale:
+            LOG.warning("Delta flash record does not match the flash at %#010x, programming everything", stale[0])
+            cache.invalidate()
+            changed = list(sectors)
+
+    runs: List[Tuple[int, List[bytes]]] = []
+    end = None
+    for s in changed:
+        if runs and end == s.address:
+            runs[-1][1].append(s.data)
         else:
-            LOG.info("Loading %s at %#010x", filename, base_address)
+            runs.append((s.address, [s.data]))
+        end = s.address + len(s.data)
+
+    programmed = sum(len(s.data) for s in changed)
+    start_time = time.perf_counter()
+    if runs:
+        cache.invalidate()
+        perfCounters.start_flash(programmed)
+
+        def loader_progress(fraction):
+            perfCounters.flash_progress(fraction)
+            if progress is not None:
+                progress(fraction)
+
+        loader = (loader_class or FlashLoader)(session, progress=loader_progress, chip_erase="sector", smart_flash=False)
+        for address, chunks in runs:
+            loader.add_data(address, b''.join(chunks))
+        loader.commit()
+    program_time = time.perf_counter() - start_time
+
+    verified = None
+    if verify:
+        # the skipped sectors were checked above
+        verified = not changed or not verify_image(session, changed)["failed"]
+        if not verified:
+            cache.invalidate()
+            raise RuntimeError("Delta flash verify failed")
+
+    total = sum(len(s.data) for s in sectors)
+    skipped = total - programmed
+    if programmed and program_time:
+        cache.rate = programmed / program_time
+    rate = cache.rate
+    cache.save(sector_size, {s.sector: s.sha1 for s in sectors}, image.key)
+    return {
+        "total": total,
+        "programmed": programmed,
+        "skipped": skipped,
+        "sectors": len(changed),
+        "sector_size": sector_size,
+        "time": program_time,
+        "saved": skipped / rate if rate else 0.0,
+        "verified": verified,
+        }
+
+#校验
+def verify_readback(target, sectors: Sequence[ImageSector], progress=None, batch_size: int = 64 * 1024) -> List[ImageSector]:
+    """@brief Read @a sectors back and return the ones whose CRC32 differs from the image.
+
+    Contiguous sectors are read in blocks of up to @a batch_size bytes, so the link carries a few
+    large transfers instead of one per sector.
+    """
+    runs: List[List[ImageSector]] = []
+    for s in sectors:
+        if runs and runs[-1][-1].address + len(runs[-1][-1].data) == s.address \
+                and s.address + len(s.data) - runs[-1][0].address <= batch_size:
+            runs[-1].append(s)
+        else:
+            runs.append([s])
+    failed = []
+    total = sum(len(s.data) for s in sectors) or 1
+    done = 0
+    for run in runs:
+        start = run[0].address
+        data = bytes(target.read_memory_block8(start, run[-1].address + len(run[-1].data) - start))
+        for s in run:
+            offset = s.address - start
+            if zlib.crc32(data[offset:offset + len(s.data)]) != s.crc:
+                failed.append(s)
+            done += len(s.data)
+        if progress is not None:
+            progress(done / total)
+    return failed
+
+#片上CRC
+# Thumb code (ARMv6-M, so it runs on any Cortex-M) for the zlib CRC32 of a list of ranges:
+# r0 = list of (address, length) word pairs, r1 = number of pairs, r2 = 256-word lookup table.
+# Each pair's address word is replaced by the CRC of its range; returns 0 through lr, no stack used.
+_CRC32_CODE = (
+    0xd0142900, 0x68446803, 0x43ed2500, 0xd0092c00, 0x3301781e, 0xb2f6406e, 0x599600b6, 0x40750a2d,
+    0xd1f53c01, 0x600543ed, 0x39013008, 0x2000e7e8, 0xbf004770,
+    )
+
+def crc32_table() -> List[int]:
+    table = []
+    for n in range(256):
+        crc = n
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xedb88320 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+class TargetCrc32:
+    """@brief Computes CRC32s of flash ranges on the MCU with _CRC32_CODE.
+
+    pyOCD's own analyzer is turned off for every pack flash algorithm, and it encodes the block
+    number in 16 bits, which overflows for flash at 0x08000000. The code, its table and the range
+    list are loaded at the bottom of the flash algorithm's stack area, just above the canary pyOCD
+    keeps there, leaving at least STACK_RESERVE bytes of stack. The routine is called the same way
+    pyOCD calls the algorithm's functions and returns to the breakpoint at its load address.
+    """
+    BATCH = 32
+    STACK_RESERVE = 1024
+    _noted: Set[str] = set()
+
+    def __init__(self, session, flash, region, base: int):
+        self.target = session.target
+        self.flash = flash
+        self.region = region
+        self.timeout = getattr(session, "options", {}).get("flash.timeout.analyzer")
+        self.code_address = base
+        self.table_address = base + len(_CRC32_CODE) * 4
+        self.list_address = self.table_address + 256 * 4
+
+    @classmethod
+    def size(cls) -> int:
+        return (len(_CRC32_CODE) + 256 + 2 * cls.BATCH) * 4
+
+    @classmethod
+    def for_region(cls, session, region) -> Tuple[Optional["TargetCrc32"], str]:
+        """@brief The engine for flash @a region, or None and the reason it cannot be used."""
+        flash = getattr(region, "flash", None)
+        algo = getattr(flash, "flash_algo", None)
+        if not algo:
+            return None, "no flash algorithm"
+        end_stack, begin_stack = algo.get("end_stack"), algo.get("begin_stack")
+        if end_stack is None or begin_stack is None:
+            return None, "the flash algorithm does not give its stack range"
+        base = (end_stack + 4 + 3) & ~3
+        if begin_stack - (base + cls.size()) < cls.STACK_RESERVE:
+            return None, "not enough RAM next to the flash algorithm"
+        return cls(session, flash, region, base), ""
+
+    def contains(self, s: ImageSector) -> bool:
+        return self.region.start <= s.address and s.address + len(s.data) <= self.region.start + self.region.length
+
+    def load(self) -> None:
+        self.target.write_memory_block32(self.code_address, list(_CRC32_CODE) + crc32_table())
+
+    def compute(self, ranges: Sequence[Tuple[int, int]]) -> List[int]:
+        """@brief CRC32 of each (address, length) in @a ranges; load() must have been called."""
+        crcs = []
+        for n in range(0, len(ranges), self.BATCH):
+            chunk = ranges[n:n + self.BATCH]
+            self.target.write_memory_block32(self.list_address, [word for pair in chunk for word in pair])
+            result = self.flash._call_function_and_wait(self.code_address, self.list_address, len(chunk),
+                                                        self.table_address, timeout=self.timeout)
+            if result != 0:
+                raise RuntimeError("on-target CRC did not complete (result %d)" % result)
+            crcs += self.target.read_memory_block32(self.list_address, 2 * len(chunk))[::2]
+        return crcs
+
+def flash_crc_engine(session, address: int) -> Optional[TargetCrc32]:
+    """@brief TargetCrc32 for the flash region at @a address, or None if it has to be read back.
+
+    Why the on-target CRC cannot be used is logged once per reason.
+    """
+    region = session.target.memory_map.get_region_for_address(address)
+    if region is None or not region.is_flash:
+        engine, reason = None, "%#010x is not in a flash region" % address
+    else:
+        engine, reason = TargetCrc32.for_region(session, region)
+    if engine is None and reason not in TargetCrc32._noted:
+        TargetCrc32._noted.add(reason)
+        LOG.info("Verifying by readback, on-target CRC not available: %s", reason)
+    return engine
+
+def verify_on_target(session, sectors: Sequence[ImageSector], progress=None,
+                     batch: int = 32) -> Tuple[List[ImageSector], List[ImageSector]]:
+    """@brief Check @a sectors against CRC32s computed on the MCU by TargetCrc32.
+
+    Only one word per sector comes back over SWD. Returns (failed, unchecked); unchecked is
+    everything outside the first sector's flash region, or everything if the engine cannot be used.
+    """
+    engine = flash_crc_engine(session, sectors[0].address) if sectors else None
+    if engine is None:
+        return [], list(sectors)
+    mine = [s for s in sectors if engine.contains(s)]
+    unchecked = [s for s in sectors if not engine.contains(s)]
+    failed = []
+    flash = engine.flash
+    flash.init(flash.Operation.VERIFY)
+    try:
+        engine.load()
+        for n in range(0, len(mine), batch):
+            chunk = mine[n:n + batch]
+            crcs = engine.compute([(s.address, len(s.data)) for s in chunk])
+            failed += [s for s, crc in zip(chunk, crcs) if crc != s.crc]
+            if progress is not None:
+                progress((n + len(chunk)) / len(mine))
+    finally:
+        flash.cleanup()
+    return failed, unchecked
 
-        programmer.program(filename,
-                        base_address=0x8000000,
-                        file_format=None)
+def verify_image(session, sectors: Sequence[ImageSector], progress=None, mode: str = None) -> Dict[str, Any]:
+    """@brief Compare @a sectors with the flash contents.
+
+    Sectors are checked with on-target CRCs where possible and by batched readback otherwise.
+    @a mode "readback" skips the on-target CRC; the default comes from verify_mode in config.ini.
+    Running the CRC routine halts the core, so the target is reset afterwards.
+    """
+    mode = mode or read_config("verify_mode") or "auto"
+    start = time.perf_counter()
+    failed, unchecked = [], list(sectors)
+    if mode != "readback":
+        try:
+            failed, unchecked = verify_on_target(session, sectors, progress)
+        except Exception as e:
+            LOG.warning("On-target CRC failed, reading back instead: %s", e)
+            failed, unchecked = [], list(sectors)
+        if len(unchecked) != len(sectors):
+            session.target.reset()
+            sessionManager.note_reset()
+    if unchecked:
+        failed += verify_readback(session.target, unchecked, progress, read_config_int("verify_batch_size", 64 * 1024))
+    elapsed = time.perf_counter() - start
+    perfCounters.record_phase("verify", elapsed)
+    return {
+        "bytes": sum(len(s.data) for s in sectors),
+        "crc_sectors": len(sectors) - len(unchecked),
+        "readback_sectors": len(unchecked),
+        "failed": [s.sector for s in failed],
+        "time": elapsed,
+        }
+
+def verify_summary(result: Dict[str, Any]) -> str:
+    text = "%d B verified in %.2fs (%d sectors CRC on target, %d read back)" % (
+        result["bytes"], result["time"], result["crc_sectors"], result["readback_sectors"])
+    if result["failed"]:
+        text += ", mismatch at " + ", ".join("%#010x" % sector for sector in result["failed"][:8])
+    return text
+
+def verify_job(job: Job, unique_id: Optional[str], pack_path: Optional[str], target_name: Optional[str],
+               filename: str):
+    prepared = imageCache.prepare(filename, flash_sector_guess(target_name))
+    with sessionManager.acquire(unique_id, pack_path, target_name) as session:
+        job.check_cancelled()
+        image = prepared.result()
+        sector_size, erased = flash_sector_layout(session, image.start)
+        remember_flash_sector(target_name, sector_size)
+        result = verify_image(session, image.sectors(sector_size, erased), job.set_progress)
+        if result["failed"]:
+            # the flash is not what the delta record says, if the record is for this image
+            DeltaFlashCache(session.probe.unique_id, target_name).invalidate()
+    job.message = verify_summary(result)
+    if result["failed"]:
+        raise RuntimeError("verify failed: %s" % job.message)
+    return result
+
+def delta_summary(result: Dict[str, Any]) -> str:
+    return "%d sectors, %d B written, %d B skipped, %.2fs (saved ~%.2fs)%s" % (
+        result["sectors"], result["programmed"], result["skipped"], result["time"], result["saved"],
+        ", verified" if result["verified"] else "")
+
+def erase_callback(sender, app_data):
+    print('OK was clicked.')
+    print("Sender: ", sender)
+    print("App Data: ", app_data)
+    pack_path = dpg.get_value("pack_path") or None
+    target_name = dpg.get_value("target_name") or None
+    dpg.set_value("flash_progress_bar", 0)
+    jobExecutor.submit("擦除", erase_job, selected_probe_uid(), pack_path, target_name)
+
+
+def load_callback(sender, app_data):
+    print('OK was clicked.')
+    print("Sender: ", sender)
+    print("App Data: ", app_data)
+    pack_path = dpg.get_value("pack_path") or None
+    target_name = dpg.get_value("target_name") or None
+    filename = dpg.get_value("bin_path");
+    if len(filename)==0 :
+        print('Bin path is NULL.')
+        return
+    dpg.set_value("flash_progress_bar", 0)
+    if dpg.get_value("delta_flash"):
+        jobExecutor.submit("差分烧录 %s" % os.path.basename(filename), delta_program_job, selected_probe_uid(),
+                           pack_path, target_name, filename, dpg.get_value("flash_verify"))
+    else:
+        jobExecutor.submit("烧录 %s" % os.path.basename(filename), program_job, selected_probe_uid(), pack_path,
+                           target_name, filename, dpg.get_value("flash_verify"))
+
+def verify_callback(sender, app_data):
+    filename = dpg.get_value("bin_path")
+    if not filename:
+        print('Bin path is NULL.')
+        return
+    dpg.set_value("flash_progress_bar", 0)
+    jobExecutor.submit("校验 %s" % os.path.basename(filename), verify_job, selected_probe_uid(),
+                       dpg.get_value("pack_path") or None, dpg.get_value("target_name") or None, filename)
+
+def flash_option_callback(sender, app_data):
+    save_config(str(sender), "1" if app_data else "0")
+
+#量产烧录
+class MockProbe:
+    """@brief Stand-in for a debug probe so gang programming can run without hardware.
+
+    Enabled with gang_mock_probes=<count> in config.ini; gang_mock_time sets the simulated
+    programming time in seconds and gang_mock_fail lists mock IDs that should fail.
+    """
+    def __init__(self, unique_id: str, program_time: float = 2.0, fail: bool = False):
+        self.unique_id = unique_id
+        self.description = "Mock Probe"
+        self.program_time = program_time
+        self.fail = fail
+
+    def program(self, slot: "GangSlot", filename: str) -> None:
+        steps = 20
+        for i in range(steps):
+            time.sleep(self.program_time / steps)
+            slot.set_progress((i + 1) / steps)
+        if self.fail:
+            raise RuntimeError("verify failed")
+
+_mock_probes: Dict[str, MockProbe] = {}
+
+def mock_probes() -> List[MockProbe]:
+    count = read_config_int("gang_mock_probes", 0)
+    program_time = read_config_float("gang_mock_time", 2.0)
+    failing = [c.strip() for c in read_config("gang_mock_fail").split(',')]
+    for i in range(count):
+        unique_id = "MOCK%04d" % i
+        if unique_id not in _mock_probes:
+            _mock_probes[unique_id] = MockProbe(unique_id, program_time, unique_id in failing)
+    return [_mock_probes["MOCK%04d" % i] for i in range(count)]
+
+
+class GangSlot:
+    """@brief Progress and result of one probe in a gang programming run."""
+    WAITING = "等待"
+    RUNNING = "烧录中"
+    PASSED = "通过"
+    FAILED = "失败"
+    CANCELLED = "取消"
+
+    def __init__(self, unique_id: str, job: Job = None):
+        self.unique_id = unique_id
+        self.job = job
+        self.status = GangSlot.WAITING
+        self.progress = 0.0
+        self.elapsed = 0.0
+        self.message = ""
+
+    def set_progress(self, progress: float) -> None:
+        self.progress = progress
+        if self.job is not None:
+            self.job.check_cancelled()
+
+
+# pack targets are registered globally by pyOCD, so sessions are opened one at a time
+_gang_open_lock = threading.Lock()
+
+def gang_program_probe(slot: GangSlot, pack_path: Optional[str], target_name: Optional[str], filename: str) -> None:
+    """@brief Program one probe of a gang run with its own session."""
+    mock = _mock_probes.get(slot.unique_id)
+    if mock is not None:
+        mock.program(slot, filename)
+        return
+    with _gang_open_lock:
+        session = ConnectHelper.session_with_chosen_probe(
+                            pack=pack_path,
+                            unique_id=slot.unique_id,
+                            blocking=False,
+                            options = session_options(slot.unique_id, target_name),
+                            )
+        if session is None:
+            raise RuntimeError("probe %s not found" % slot.unique_id)
+        session.open()
+    with session:
+        # every probe in the run shares the one parsed image
+        image = imageCache.prepare(filename).result()
+        cache = DeltaFlashCache(slot.unique_id, target_name)
+        cache.invalidate()
+        loader = FlashLoader(session, progress=slot.set_progress)
+        for address, data in image.segments:
+            loader.add_data(address, data)
+        loader.commit()
+        cache.record(session, image, target_name)
+
+
+class GangProgrammer:
+    """@brief Flash the same image to several probes at once, one worker thread per probe.
+
+    @a program_func(slot, pack_path, target_name, filename) does the work for a single probe and
+    can be swapped out to drive the run without hardware.
+    """
+    def __init__(self, unique_ids: List[str], pack_path: Optional[str], target_name: Optional[str],
+                 filename: str, program_func=gang_program_probe):
+        self.slots = [GangSlot(unique_id) for unique_id in unique_ids]
+        self.pack_path = pack_path
+        self.target_name = target_name
+        self.filename = filename
+        self.program_func = program_func
+        self.wall_time = 0.0
+        self.finished = False
+
+    def _run_slot(self, slot: GangSlot) -> None:
+        slot.status = GangSlot.RUNNING
+        start = time.perf_counter()
+        try:
+            self.program_func(slot, self.pack_path, self.target_name, self.filename)
+            slot.status = GangSlot.PASSED
+        except JobCancelled:
+            slot.status = GangSlot.CANCELLED
+        except Exception as e:
+            LOG.error("Gang programming %s failed: %s", slot.unique_id, e)
+            slot.message = str(e)
+            slot.status = GangSlot.FAILED
+        slot.elapsed = time.perf_counter() - start
+
+    def run(self, job: Job = None) -> str:
+        start = time.perf_counter()
+        threads = []
+        for slot in self.slots:
+            slot.job = job
+            thread = threading.Thread(target=self._run_slot, args=(slot,), daemon=True)
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        self.wall_time = time.perf_counter() - start
+        self.finished = True
+        return self.summary()
+
+    @property
+    def serial_time(self) -> float:
+        return sum(slot.elapsed for slot in self.slots)
+
+    def summary(self) -> str:
+        passed = sum(1 for slot in self.slots if slot.status == GangSlot.PASSED)
+        wall = self.wall_time if self.finished else 0.0
+        return "%d/%d 通过  wall %.1fs  serial %.1fs  speedup %.1fx" % (
+            passed, len(self.slots), wall, self.serial_time, self.serial_time / wall if wall else 0.0)
+
+
+gangProgrammer: Optional[GangProgrammer] = None
+
+def gang_refresh_callback(sender, app_data):
+    global _gang_list_scan
+    fill_gang_probes(list_devices())
+    # refill once the rescan list_devices() asked for has finished
+    _gang_list_scan = probeWatcher.scans
+
+_gang_list_scan = None
+
+def update_gang_probes() -> None:
+    """@brief Frame handler: after the refresh button, refill the gang list from the next scan."""
+    global _gang_list_scan
+    if _gang_list_scan is None or probeWatcher.scans == _gang_list_scan:
+        return
+    if gangProgrammer is not None and not gangProgrammer.finished:
+        return          # keep the rows of a running batch
+    _gang_list_scan = None
+    fill_gang_probes(probeWatcher.labels)
+
+def fill_gang_probes(labels: List[str]) -> None:
+    probes = [(_probe_uids[label], label) for label in labels]
+    probes += [(probe.unique_id, "%s [%s]" % (probe.description, probe.unique_id)) for probe in mock_probes()]
+    dpg.delete_item("gang_probes", children_only=True)
+    for unique_id, label in probes:
+        with dpg.group(horizontal=True, parent="gang_probes"):
+            dpg.add_checkbox(tag="gang_check_" + unique_id, label=label, default_value=True, user_data=unique_id)
+            dpg.add_progress_bar(tag="gang_bar_" + unique_id, default_value=0.0, width=200)
+            dpg.add_text(tag="gang_status_" + unique_id, default_value="")
+
+def gang_start_callback(sender, app_data):
+    global gangProgrammer
+    if gangProgrammer is not None and not gangProgrammer.finished:
+        print("Gang programming already running")
+        return
+    filename = dpg.get_value("bin_path")
+    if len(filename) == 0:
+        print('Bin path is NULL.')
+        return
+    unique_ids = []
+    for row in dpg.get_item_children("gang_probes", 1):
+        check = dpg.get_item_children(row, 1)[0]
+        if dpg.get_value(check):
+            unique_ids.append(dpg.get_item_user_data(check))
+    if not unique_ids:
+        print("No probe selected")
+        return
+    # the probes are opened by the gang workers, release any shared session first
+    rttThread.DisConnect()
+    sessionManager.invalidate()
+    gangProgrammer = GangProgrammer(unique_ids, dpg.get_value("pack_path") or None,
+                                    dpg.get_value("target_name") or None, str(Path(filename).expanduser().resolve()))
+    jobExecutor.submit("量产烧录 x%d" % len(unique_ids), gangProgrammer.run)
+
+def update_gang_view() -> None:
+    gang = gangProgrammer
+    if gang is None:
+        return
+    for slot in gang.slots:
+        if dpg.does_item_exist("gang_bar_" + slot.unique_id):
+            dpg.set_value("gang_bar_" + slot.unique_id, slot.progress)
+            status = slot.status if not slot.message else "%s: %s" % (slot.status, slot.message)
+            if slot.elapsed:
+                status += " %.1fs" % slot.elapsed
+            dpg.set_value("gang_status_" + slot.unique_id, status)
+    dpg.set_value("gang_summary", gang.summary())
 
 def pack_cancel_callback(sender, app_data):
     print('Cancel was clicked.')
@@ -801,6 +4409,8 @@ def pack_cancel_callback(sender, app_data):
     print("App Data: ", app_data)
 
 def start_ui():
+    global targetTable
+    targetTable = TargetTableView("pack_table", "pack_table_scroll", read_config_int("target_table_rows", 14))
     dpg.add_texture_registry(label="Demo Texture Container", tag="__demo_texture_container")
     dpg.add_colormap_registry(label="Demo Colormap Registry", tag="__demo_colormap_registry")
 
@@ -819,11 +4429,19 @@ def start_ui():
                     dpg.add_menu_item(label="版本:V0.1.0")
         with dpg.collapsing_header(label="Links", default_open=True):
             with dpg.group(horizontal=True):
-                if len(list_devices()):
-                    dpg.add_combo( tag="links",items=list_devices(),default_value=list_devices()[0])
-                else:
-                    dpg.add_combo( tag="links",default_value="No device found.")
+                dpg.add_combo( tag="links",default_value="Searching...", callback=links_callback)
                 dpg.add_button(tag="list_devices",label="刷新",user_data=dpg.last_container(), callback=list_devices_callback)
+                dpg.add_combo(tag="swd_frequency", items=[SWD_AUTO] + [frequency_label(f) for f in SWD_FREQUENCIES],
+                              default_value=swd_frequency_setting_label(), width=120, callback=swd_frequency_callback)
+                dpg.add_button(tag="swd_autotune", label="自动调速", callback=swd_autotune_callback)
+                dpg.add_button(tag="session_disconnect",label="断开目标", callback=session_disconnect_callback)
+                dpg.add_text(tag="session_status", default_value="未连接")
+            with dpg.group(horizontal=True):
+                dpg.add_combo(tag="profile", items=profile_names(), default_value=read_config("profile"), width=200,
+                              callback=profile_callback)
+                dpg.add_input_text(tag="profile_name", hint="配置名", default_value=read_config("profile"), width=200)
+                dpg.add_button(label="保存配置", callback=profile_save_callback)
+                dpg.add_button(label="删除配置", callback=profile_delete_callback)
 
         with dpg.collapsing_header(label="Pack 设置", default_open=False):
             with dpg.child_window(autosize_x=True, height=50):
@@ -837,20 +4455,28 @@ def start_ui():
                         dpg.add_file_extension(".pack", color=(255, 255, 255, 255))
                     dpg.add_button(label="选择Pack",user_data=dpg.last_container(), callback=lambda s, a, u: dpg.configure_item(u, show=True))
             with dpg.child_window(autosize_x=True, height=400):
-                dpg.add_button(label="显示Target", callback=show_target)
-                with dpg.table(tag="pack_table",header_row=True, policy=dpg.mvTable_SizingFixedFit, row_background=True, reorderable=True, 
-                            resizable=True, no_host_extendX=False, hideable=True, 
-                            borders_innerV=True, delay_search=True, borders_outerV=True, borders_innerH=True, borders_outerH=True,width=1400,height=600):
+                with dpg.group(horizontal=True):
+                    dpg.add_button(label="显示Target", callback=show_target)
+                    dpg.add_input_text(tag="target_filter", hint="过滤 Name/Vendor/Part Number/Families", width=400, callback=target_filter_callback)
+                    dpg.add_text(tag="target_count", default_value="")
+                with dpg.group(horizontal=True):
+                    dpg.add_slider_int(tag="pack_table_scroll", vertical=True, min_value=0, max_value=0, height=330, callback=target_scroll_callback)
+                    with dpg.table(tag="pack_table",header_row=True, policy=dpg.mvTable_SizingFixedFit, row_background=True, reorderable=True, 
+                                resizable=True, no_host_extendX=False, hideable=True, 
+                                borders_innerV=True, delay_search=True, borders_outerV=True, borders_innerH=True, borders_outerH=True,width=1400,height=330):
 
-                    dpg.add_table_column(label="Name", width_stretch=True, init_width_or_weight=0.0)
-                    dpg.add_table_column(label="Vendor", width_stretch=True, init_width_or_weight=0.0)
-                    dpg.add_table_column(label="Part Number", width_stretch=True, init_width_or_weight=0.0)
-                    dpg.add_table_column(label="Families",width_stretch=True, init_width_or_weight=0.0)
-                    dpg.add_table_column(label="Source", width_stretch=True, init_width_or_weight=0.0)
+                        dpg.add_table_column(label="Name", width_stretch=True, init_width_or_weight=0.0)
+                        dpg.add_table_column(label="Vendor", width_stretch=True, init_width_or_weight=0.0)
+                        dpg.add_table_column(label="Part Number", width_stretch=True, init_width_or_weight=0.0)
+                        dpg.add_table_column(label="Families",width_stretch=True, init_width_or_weight=0.0)
+                        dpg.add_table_column(label="Source", width_stretch=True, init_width_or_weight=0.0)
+                        targetTable.build_pool()
+                with dpg.handler_registry():
+                    dpg.add_mouse_wheel_handler(callback=target_wheel_callback)
 
 
         with dpg.collapsing_header(label="固件烧录", default_open=True):
-            with dpg.child_window(autosize_x=True, height=170):
+            with dpg.child_window(autosize_x=True, height=300):
                 with dpg.group(horizontal=True):
                     dpg.add_input_text(  multiline=False, tracked=True,callback=intput_callback, track_offset=1, width=400, height=0,tag="target_name",default_value=read_config("target_name"))
                     dpg.add_button(label="选择Target")
@@ -863,8 +4489,27 @@ def start_ui():
                 with dpg.group(horizontal=True):
                     dpg.add_button(label="擦除固件",callback=   erase_callback)
                     dpg.add_button(label="烧录固件",callback=   load_callback)
+                    dpg.add_button(label="校验固件",callback=   verify_callback)
+                    dpg.add_checkbox(tag="delta_flash", label="差分烧录", default_value=read_config("delta_flash") == "1", callback=flash_option_callback)
+                    dpg.add_checkbox(tag="flash_verify", label="烧录后校验", default_value=read_config("flash_verify") != "0", callback=flash_option_callback)
                 with dpg.group(horizontal=True):
                     dpg.add_progress_bar(label="Progress Bar", default_value=0.0, width=400, height=0, tag="flash_progress_bar")
+                    dpg.add_button(label="取消全部", callback=lambda: jobExecutor.cancel_all())
+                with dpg.table(tag="job_table", header_row=True, row_background=True, borders_innerH=True, height=-1):
+                    dpg.add_table_column(label="#")
+                    dpg.add_table_column(label="任务", width_stretch=True)
+                    dpg.add_table_column(label="状态")
+                    dpg.add_table_column(label="进度")
+                    dpg.add_table_column(label="耗时")
+                    dpg.add_table_column(label="")
+
+        with dpg.collapsing_header(label="量产烧录", default_open=False):
+            with dpg.child_window(autosize_x=True, height=300):
+                with dpg.group(horizontal=True):
+                    dpg.add_button(label="刷新探针", callback=gang_refresh_callback)
+                    dpg.add_button(label="开始量产", callback=gang_start_callback)
+                    dpg.add_text(tag="gang_summary", default_value="")
+                dpg.add_child_window(tag="gang_probes", autosize_x=True, height=-1)
 
         with dpg.collapsing_header(label="RTT Viewer", default_open=True):
             with dpg.child_window(autosize_x=True, height=370):
@@ -872,34 +4517,763 @@ def start_ui():
                     dpg.add_button(tag="rtt_connect",label="连接",callback=   rtt_connect_callback)
                     dpg.add_button(tag="rtt_disconnect",label="断开连接",callback=   rtt_disconnect_callback)
                     dpg.add_button(tag="rtt_clear",label="清除日志",callback=   rtt_clear_callback)
-                dpg.add_input_text(tag="rtt_log",  multiline=True, readonly=True, width=-1, height=-1)
+                    dpg.add_checkbox(tag="rtt_log_follow",label="跟随",default_value=True,callback=lambda s, a: rttThread.refresh_views())
+                    dpg.add_button(tag="rtt_record_start",label="开始录制",callback=   rtt_record_start_callback)
+                    dpg.add_button(tag="rtt_record_stop",label="停止录制",callback=   rtt_record_stop_callback)
+                    dpg.add_text(tag="rtt_record_status", default_value="")
+                dpg.add_text(tag="rtt_stats", default_value="")
+                with dpg.group(horizontal=True):
+                    dpg.add_combo(tag="rtt_down_chan", items=[], width=150, callback=rtt_down_chan_callback)
+                    dpg.add_input_text(tag="rtt_input", width=400, on_enter=True, callback=rtt_send_callback)
+                    dpg.add_button(tag="rtt_send", label="发送", callback=rtt_send_callback)
+                with dpg.tab_bar(tag="rtt_tabs"):
+                    with dpg.tab(tag="rtt_tab_0", label="0", user_data=0):
+                        add_rtt_channel_widgets(rttThread.channels[0])
+
+        with dpg.collapsing_header(label="变量监视", default_open=False):
+            add_watch_widgets()
+
+        with dpg.collapsing_header(label="性能", default_open=False):
+            add_perf_widgets()
+
+        with dpg.collapsing_header(label="RTT 回放", default_open=False):
+            with dpg.child_window(autosize_x=True, height=370):
+                with dpg.group(horizontal=True):
+                    dpg.add_input_text(tag="rtt_replay_path", width=400)
+                    with dpg.file_dialog(label="选择录制文件", width=600, height=400, show=False, callback=replay_file_callback,
+                                         tag="replay_file_dialog_id", cancel_callback=pack_cancel_callback):
+                        dpg.add_file_extension(".log", color=(255, 255, 255, 255))
+                    dpg.add_button(label="选择文件",user_data=dpg.last_container(), callback=lambda s, a, u: dpg.configure_item(u, show=True))
+                    dpg.add_button(label="打开",callback=replay_open_callback)
+                    dpg.add_text(tag="rtt_replay_status", default_value="")
+                with dpg.group(horizontal=True):
+                    dpg.add_slider_int(tag="rtt_replay_scroll", vertical=True, min_value=0, max_value=0, height=300, callback=replay_scroll_callback)
+                    dpg.add_input_text(tag="rtt_replay_log", multiline=True, readonly=True, width=-1, height=-1)
         #print(os.getcwd())
+def ui_font_chars() -> List[int]:
+    """@brief Non-ASCII characters used by the widgets built so far."""
+    chars = set()
+    for item in dpg.get_all_items():
+        texts = [dpg.get_item_label(item) or '']
+        config = dpg.get_item_configuration(item)
+        texts.append(config.get("hint") or '')
+        texts.extend(i for i in config.get("items") or () if isinstance(i, str))
+        value = dpg.get_value(item)
+        if isinstance(value, str):
+            texts.append(value)
+        for text in texts:
+            if not text.isascii():
+                chars.update(ord(c) for c in text if ord(c) > 0x7f)
+    return sorted(chars)
+
+def load_full_font() -> None:
+    """@brief Build the full CJK glyph range and switch to it (font_full_cjk = 1).
+
+    The atlas is rasterized on the render thread, so this stalls the frame it runs in for as long
+    as the range takes to build; GlyphFont avoids that by only adding glyphs actually shown.
+    """
+    with startupTimer.phase("font_full"):
+        with dpg.font_registry():
+            with dpg.font(resource_path(os.path.join("res","NotoSerifCJKjp-Medium.otf")), 26, tag="custom font"):
+                dpg.add_font_range_hint(dpg.mvFontRangeHint_Chinese_Simplified_Common)
+        dpg.bind_font("custom font")
+
+class GlyphFont:
+    """@brief UI font holding only the non-ASCII glyphs in use, grown as new ones appear.
+
+    Dear PyGui can only rasterize a font atlas on the render thread, so instead of the full CJK
+    range (thousands of glyphs) the atlas holds the few hundred the widgets and logs show. Every
+    @a interval seconds the widget texts are scanned; new characters rebuild the small atlas in
+    one frame. The set is saved in cache/fonts/glyphs.json, so the next start builds it up front.
+    """
+    def __init__(self, filename: str, size: int, interval: float = 2.0):
+        self.filename = filename
+        self.size = size
+        self.interval = interval
+        self.path = os.path.join(cache_dir("fonts"), "glyphs.json")
+        self.chars = set()
+        self.builds = 0
+        self._font = None
+        self._scanned = 0.0
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self.chars.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+
+    def build(self, chars: Iterable[int] = ()) -> None:
+        self.chars.update(chars)
+        self.builds += 1
+        old = self._font
+        with dpg.font_registry():
+            with dpg.font(self.filename, self.size, tag="ui font %d" % self.builds) as font:
+                dpg.add_font_chars(sorted(self.chars))
+        dpg.bind_font(font)
+        if old is not None:
+            dpg.delete_item(old)
+        self._font = font
+
+    def save(self) -> None:
+        temp = self.path + ".tmp"
+        with open(temp, 'w', encoding="utf-8") as f:
+            json.dump(sorted(self.chars), f)
+        os.replace(temp, self.path)
+
+    def update(self) -> None:
+        """@brief Frame handler: add the glyphs of any new characters on screen."""
+        now = time.perf_counter()
+        if now - self._scanned < self.interval:
+            return
+        self._scanned = now
+        new = set(ui_font_chars()) - self.chars
+        if new:
+            with startupTimer.phase("font_grow"):
+                self.build(new)
+            self.save()
+            LOG.debug("Added %d glyphs to the UI font (%d total)", len(new), len(self.chars))
+
+glyphFont: Optional[GlyphFont] = None
+
 def show_ui():
     filename = resource_path(os.path.join("res","NotoSerifCJKjp-Medium.otf"))
     UsePlatform()
-    dpg.create_context()
-    dpg.create_viewport(title='PyOcdTools', width=window_width, height=window_height)
-    with dpg.font_registry():
-        with dpg.font(filename, 26, tag="custom font"):
-            dpg.add_font_range_hint(dpg.mvFontRangeHint_Chinese_Simplified_Common)
-        dpg.bind_font(dpg.last_container())
+    with startupTimer.phase("create_context"):
+        dpg.create_context()
+        dpg.create_viewport(title='PyOcdTools', width=window_width, height=window_height)
+    if platform.system() == "Windows":
+        ctypes.windll.shcore.SetProcessDpiAwareness(2)
+
+    with startupTimer.phase("start_ui"):
+        start_ui()
+    # only the glyphs the widgets use now, plus those seen in earlier runs; more are added on demand
+    global glyphFont
+    with startupTimer.phase("font_ui"):
+        glyphFont = GlyphFont(filename, 26, read_config_float("font_scan_interval", 2.0))
+        glyphFont.build(ui_font_chars())
     dpg.set_global_font_scale(1.0)
-    ctypes.windll.shcore.SetProcessDpiAwareness(2)
-
-    start_ui()
-    dpg.setup_dearpygui()
-    dpg.show_viewport()
-    dpg.start_dearpygui()
+    add_frame_handler(run_ui_calls)
+    add_frame_handler(update_links)
+    add_frame_handler(rttThread.drain)
+    add_frame_handler(update_job_table)
+    add_frame_handler(update_session_status)
+    add_frame_handler(update_gang_view)
+    add_frame_handler(update_gang_probes)
+    add_frame_handler(update_perf_view)
+    add_frame_handler(update_watch_view)
+    with startupTimer.phase("setup"):
+        dpg.setup_dearpygui()
+        dpg.show_viewport()
+    frame = 0
+    while dpg.is_dearpygui_running():
+        run_frame_handlers()
+        dpg.render_dearpygui_frame()
+        frame += 1
+        if frame == 1:
+            startupTimer.phases.append(("first_frame", time.perf_counter() - startupTimer.t0))
+            if read_config("font_full_cjk") == "1":
+                load_full_font()
+            else:
+                add_frame_handler(glyphFont.update)
+            startupTimer.report()
     dpg.destroy_context()
 
+#批处理
+def reset_job(job: Job, unique_id: Optional[str], pack_path: Optional[str], target_name: Optional[str]):
+    with sessionManager.acquire(unique_id, pack_path, target_name) as session:
+        session.board.target.reset()
+        sessionManager.note_reset()
+    job.set_progress(1.0)
+
+def rtt_capture_job(job: Job, rtt: RTTThread, seconds: float, pattern: Optional[str], out=None):
+    """@brief Print RTT output for @a seconds, or until a line matches the regex @a pattern.
+
+    Uses the session manager's session like the GUI viewer does, so it shares the connection with
+    the flash steps before and after it. Fails if @a pattern is given and never matched.
+    """
+    out = out or sys.stdout
+    regex = re.compile(pattern) if pattern else None
+    rtt.console_input = False
+    rtt.StartThread()
+    start = time.perf_counter()
+    matched = None
+    try:
+        while matched is None and time.perf_counter() - start < seconds:
+            sleep(0.02)
+            for state in list(rtt.channels.values()):
+                _, lines = rtt.consume(state)
+                for line in lines:
+                    out.write(line + "\n")
+                    if regex is not None and matched is None and regex.search(line):
+                        matched = line
+            out.flush()
+            if not rtt.thread.is_alive():
+                raise RuntimeError("RTT stopped, see the log")
+            job.set_progress(min(1.0, (time.perf_counter() - start) / seconds))
+    finally:
+        rtt.StopThread()
+    if regex is not None and matched is None:
+        raise RuntimeError("'%s' not seen within %gs" % (pattern, seconds))
+    job.message = matched or ""
+    return matched
+
+
+BATCH_STEPS = {
+    "erase": "erase",
+    "program": "program FILE [delta]",
+    "verify": "verify FILE",
+    "reset": "reset",
+    "rtt": "rtt SECONDS [PATTERN]",
+    }
+
+def parse_batch_step(text: str) -> Tuple[str, List[Any]]:
+    """@brief Split and check one step, so a bad script is rejected before anything runs.
+
+    The rtt duration comes back as a float and its pattern is checked to compile; FILE arguments
+    must exist.
+    """
+    words = shlex.split(text)
+    if not words or words[0] not in BATCH_STEPS:
+        raise ValueError("unknown step '%s', expected one of: %s" % (text, "; ".join(BATCH_STEPS.values())))
+    name, params = words[0], words[1:]
+    usage = BATCH_STEPS[name]
+    needed, allowed = {"program": (1, 2), "verify": (1, 1), "rtt": (1, 2)}.get(name, (0, 0))
+    if len(params) < needed:
+        raise ValueError("'%s' needs an argument: %s" % (text, usage))
+    if len(params) > allowed:
+        raise ValueError("'%s' has too many arguments: %s" % (text, usage))
+    if name in ("program", "verify") and not os.path.isfile(params[0]):
+        raise ValueError("'%s': no such file '%s'" % (text, params[0]))
+    if name == "program" and len(params) == 2 and params[1] != "delta":
+        raise ValueError("'%s': unknown option '%s': %s" % (text, params[1], usage))
+    if name == "rtt":
+        try:
+            seconds = float(params[0])
+        except ValueError:
+            seconds = -1.0
+        if not seconds > 0:
+            raise ValueError("'%s': SECONDS must be a positive number: %s" % (text, usage))
+        params[0] = seconds
+        if len(params) == 2:
+            try:
+                re.compile(params[1])
+            except re.error as e:
+                raise ValueError("'%s': bad PATTERN: %s" % (text, e))
+    return name, params
+
+def run_batch(steps: List[str], unique_id: Optional[str], pack_path: Optional[str], target_name: Optional[str]) -> int:
+    """@brief Run erase/program/verify/reset/rtt steps in order on one session, without the GUI.
+
+    Each step runs as a job with the same functions the GUI buttons submit. Progress goes to
+    stderr, RTT output to stdout. Stops at the first failing step; returns the process exit code.
+    """
+    try:
+        parsed = [parse_batch_step(step) for step in steps]
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    executor = JobExecutor(workers=1)
+    rtt = RTTThread()
+    rtt.unique_id, rtt.pack_path, rtt.target_name = unique_id, pack_path, target_name
+    status = 0
+    try:
+        for (name, params), text in zip(parsed, steps):
+            if name in ("program", "verify"):
+                rtt.firmware_path = params[0]
+            if name == "erase":
+                job = executor.submit(text, erase_job, unique_id, pack_path, target_name)
+            elif name == "program" and "delta" in params[1:]:
+                job = executor.submit(text, delta_program_job, unique_id, pack_path, target_name, params[0], True)
+            elif name == "program":
+                job = executor.submit(text, program_job, unique_id, pack_path, target_name, params[0])
+            elif name == "verify":
+                job = executor.submit(text, verify_job, unique_id, pack_path, target_name, params[0])
+            elif name == "reset":
+                job = executor.submit(text, reset_job, unique_id, pack_path, target_name)
+            else:
+                job = executor.submit(text, rtt_capture_job, rtt, params[0], params[1] if len(params) > 1 else None)
+            try:
+                while not job.wait(0.5):
+                    if name != "rtt":
+                        print("\r%-40s %3d%%" % (text, job.progress * 100), end="", file=sys.stderr, flush=True)
+            except KeyboardInterrupt:
+                job.cancel()
+                job.wait()
+            print("\r%-40s %s %.2fs %s" % (text, job.status, job.elapsed, job.message), file=sys.stderr)
+            if job.status != Job.DONE:
+                status = 1
+                break
+    finally:
+        executor.shutdown()
+        rtt.recorder.stop()
+        sessionManager.close()
+    return status
+
+def read_batch_script(path: str) -> List[str]:
+    """@brief Steps from a script file: one per line, '#' starts a comment."""
+    with open(path, encoding="utf-8") as f:
+        return [line.split('#', 1)[0].strip() for line in f if line.split('#', 1)[0].strip()]
+
+
+#性能测试
+class SimRTTUpChannel:
+    """@brief Simulated RTT up channel whose firmware writes at a fixed byte rate.
+
+    The target side is worked out lazily: each read() produces the lines the firmware would have
+    written since the previous read. What does not fit in the @a size byte up buffer is dropped, as
+    a non-blocking SEGGER channel does. Every line carries its production time so the consumer can
+    measure end-to-end latency.
+    """
+    def __init__(self, name: str, rate: float, size: int = 1024, line_length: int = 64):
+        self.name = name
+        self.rate = rate
+        self.size = size
+        self.line_length = max(48, line_length)
+        self.produced = 0
+        self.dropped = 0
+        self._seq = 0
+        self._credit = 0.0
+        self._last = time.perf_counter()
+
+    def _line(self, t: float) -> bytes:
+        line = "I/bench: %08d t=%.6f " % (self._seq, t)
+        self._seq += 1
+        return (line.ljust(self.line_length - 1, 'x') + "\n").encode()
+
+    def read(self) -> bytes:
+        now = time.perf_counter()
+        start, self._last = self._last, now
+        self._credit += (now - start) * self.rate
+        count = int(self._credit // self.line_length)
+        if not count:
+            return b''
+        self._credit -= count * self.line_length
+        fit = min(count, self.size // self.line_length)
+        self.dropped += (count - fit) * self.line_length
+        step = (now - start) / count
+        data = b''.join(self._line(start + (i + 1) * step) for i in range(fit))
+        self.produced += len(data)
+        return data
+
+
+class SimRTTDownChannel:
+    def __init__(self, name: str = "bench"):
+        self.name = name
+        self.written = 0
+
+    def write(self, data: bytes) -> int:
+        self.written += len(data)
+        return len(data)
+
+
+class SimFlash:
+    """@brief Simulated on-chip flash with per-sector erase time and per-byte program/read rates.
+
+    Stands in for the target's flash region (what flash_sector_layout() looks up), for the target
+    itself (read_memory_block8() used by verify) and, with @a crc_rate, for pyOCD's Flash object
+    with a flash algorithm in a simulated RAM, where calling TargetCrc32's routine takes @a call_time
+    plus @a crc_rate bytes/s.
+    """
+    RAM_BASE = 0x20000000
+    Operation = collections.namedtuple("Operation", "VERIFY")(3)
+
+    def __init__(self, size: int, sector_size: int = 2048, erase_time: float = 0.02,
+                 program_rate: float = 64 * 1024, read_rate: float = 512 * 1024, base: int = FLASH_BASE_ADDRESS,
+                 crc_rate: float = None, call_time: float = 0.002):
+        self.start = base
+        self.length = size
+        self.sector_size = sector_size
+        self.blocksize = sector_size
+        self.is_flash = True
+        self.erased_byte_value = 0xff
+        self.erase_time = erase_time
+        self.program_rate = program_rate
+        self.read_rate = read_rate
+        self.data = bytearray(b'\xff' * size)
+        self.erased_sectors = 0
+        self.programmed_bytes = 0
+        self.crc_rate = crc_rate
+        self.call_time = call_time
+        # [stack 4 KB] [page buffer] [algorithm], as pyOCD lays out a pack algorithm
+        self.ram = bytearray(0x1000 + sector_size + 0x400)
+        self.flash_algo = {"load_address": self.RAM_BASE + 0x1000 + sector_size, "begin_stack": self.RAM_BASE + 0x1000,
+                           "end_stack": self.RAM_BASE, "page_buffers": [self.RAM_BASE + 0x1000]}
+
+    @property
+    def memory_map(self) -> "SimFlash":
+        return self
+
+    def get_region_for_address(self, address: int) -> Optional["SimFlash"]:
+        return self if self.start <= address < self.start + self.length else None
+
+    def erase_sector(self, address: int) -> None:
+        offset = (address - self.start) // self.sector_size * self.sector_size
+        time.sleep(self.erase_time)
+        self.data[offset:offset + self.sector_size] = b'\xff' * self.sector_size
+        self.erased_sectors += 1
+
+    def program(self, address: int, data: bytes) -> None:
+        time.sleep(len(data) / self.program_rate)
+        offset = address - self.start
+        self.data[offset:offset + len(data)] = data
+        self.programmed_bytes += len(data)
+
+    def read_memory_block8(self, address: int, size: int) -> List[int]:
+        time.sleep(size / self.read_rate)
+        offset = address - self.start
+        return list(self.data[offset:offset + size])
+
+    def write_memory_block32(self, address: int, words: Sequence[int]) -> None:
+        offset = address - self.RAM_BASE
+        self.ram[offset:offset + 4 * len(words)] = struct.pack("<%dI" % len(words), *words)
+
+    def read_memory_block32(self, address: int, count: int) -> List[int]:
+        offset = address - self.RAM_BASE
+        return list(struct.unpack_from("<%dI" % count, self.ram, offset))
+
+    @property
+    def flash(self) -> Optional["SimFlash"]:
+        return self if self.crc_rate is not None else None
+
+    def init(self, operation) -> None:
+        time.sleep(self.call_time)
+
+    def cleanup(self) -> None:
+        pass
+
+    def _call_function_and_wait(self, pc: int, r0: int = None, r1: int = None, r2: int = None, r3: int = None,
+                                init: bool = False, timeout: float = None) -> int:
+        """@brief Runs _CRC32_CODE if it was loaded at @a pc, with the range list at @a r0."""
+        if self.read_memory_block32(pc, len(_CRC32_CODE)) != list(_CRC32_CODE):
+            return 1
+        pairs = self.read_memory_block32(r0, 2 * r1)
+        ranges = list(zip(pairs[::2], pairs[1::2]))
+        time.sleep(self.call_time + sum(size for _, size in ranges) / self.crc_rate)
+        crcs = [zlib.crc32(self.data[address - self.start:address - self.start + size]) for address, size in ranges]
+        self.write_memory_block32(r0, [word for crc, (_, size) in zip(crcs, ranges) for word in (crc, size)])
+        return 0
+
+    def reset(self) -> None:
+        pass
+
+
+class SimSession:
+    def __init__(self, flash: SimFlash, unique_id: str = "BENCH"):
+        self.target = flash
+        self.probe = SimProbe(unique_id)
+
+
+class SimFlashLoader:
+    """@brief FlashLoader stand-in that sector-erases and programs a SimFlash."""
+    def __init__(self, session: SimSession, progress=None, chip_erase=None, smart_flash=None):
+        self.flash = session.target
+        self.progress = progress
+        self.ranges: List[Tuple[int, bytes]] = []
+
+    def add_data(self, address: int, data: bytes) -> None:
+        self.ranges.append((address, bytes(data)))
+
+    def commit(self) -> None:
+        flash = self.flash
+        total = sum(len(data) for _, data in self.ranges)
+        done = 0
+        for address, data in self.ranges:
+            for offset in range(0, len(data), flash.sector_size):
+                chunk = data[offset:offset + flash.sector_size]
+                flash.erase_sector(address + offset)
+                flash.program(address + offset, chunk)
+                done += len(chunk)
+                if self.progress is not None:
+                    self.progress(done / total)
+
+
+class SimProbe:
+    def __init__(self, unique_id: str, description: str = "Simulated Probe"):
+        self.unique_id = unique_id
+        self.description = description
+
+
+def percentiles(values: Sequence[float], points: Sequence[int] = (50, 95, 99)) -> Dict[str, float]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+    result = {"p%d" % p: ordered[min(len(ordered) - 1, len(ordered) * p // 100)] for p in points}
+    result["max"] = ordered[-1]
+    return result
+
+
+# tracemalloc slows allocation-heavy code down several times, so it is only on with --bench-trace
+bench_trace_memory = False
+
+@contextmanager
+def bench_memory(result: Dict[str, Any]):
+    """@brief Adds the process's peak RSS and, when tracing, the block's peak Python allocation (KB) to @a result."""
+    if bench_trace_memory:
+        tracemalloc.start()
+    try:
+        yield
+    finally:
+        if bench_trace_memory:
+            result["traced_peak_kb"] = tracemalloc.get_traced_memory()[1] / 1024
+            tracemalloc.stop()
+        if resource is not None:
+            result["max_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+_BENCH_TIMESTAMP = re.compile(r" t=(\d+\.\d+) ")
+
+def bench_rtt(duration: float, rate: float, channels: int = 1, size: int = 1024, line_length: int = 64,
+              fps: int = 60) -> Dict[str, Any]:
+    """@brief RTTThread.viewer_loop against simulated up channels, drained at the frame rate."""
+    result: Dict[str, Any] = {}
+    with bench_memory(result):
+        thread = RTTThread()
+        ups = [SimRTTUpChannel("bench%d" % i, rate, size, line_length) for i in range(channels)]
+        downs = [SimRTTDownChannel()]
+        thread.set_channels(ups, downs)
+        thread.alive.set()
+        worker = threading.Thread(target=thread.viewer_loop, args=(ups, downs, NullKBHit(), threading.Lock()),
+                                  daemon=True)
+        latencies = []
+        frames = []
+        lines_total = 0
+        cpu = time.process_time()
+        start = time.perf_counter()
+        worker.start()
+        while time.perf_counter() - start < duration:
+            time.sleep(1 / fps)
+            frame_start = time.perf_counter()
+            for state in list(thread.channels.values()):
+                _, lines = thread.consume(state)
+                lines_total += len(lines)
+                for line in lines:
+                    m = _BENCH_TIMESTAMP.search(line)
+                    if m:
+                        latencies.append((frame_start - float(m.group(1))) * 1000)
+            frames.append((time.perf_counter() - frame_start) * 1000)
+        thread.alive.clear()
+        worker.join()
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu
+    produced = sum(chan.produced for chan in ups)
+    result.update({
+        "offered_kbps": rate * channels / 1024,
+        "captured_kbps": thread.stats.captured_bytes / 1024 / elapsed,
+        "dropped_kb": sum(chan.dropped for chan in ups) / 1024,
+        "lines_per_s": lines_total / elapsed,
+        "polls_per_s": thread.stats.polls / elapsed,
+        "cpu_pct": cpu / elapsed * 100,
+        "latency_ms": percentiles(latencies),
+        "frame_ms": percentiles(frames),
+        "loss_pct": 100 - produced * 100 / max(1, produced + sum(chan.dropped for chan in ups)),
+        })
+    return result
+
+
+def bench_flash(image_size: int = 64 * 1024, changed: int = 2, sector_size: int = 2048,
+                erase_time: float = 0.02, program_rate: float = 64 * 1024) -> Dict[str, Any]:
+    """@brief Full, delta and unchanged programming of one image through delta_program() on a SimFlash,
+    then verify_image() of the whole image by readback and by on-target CRC."""
+    result: Dict[str, Any] = {}
+    flash = SimFlash(max(image_size, sector_size) * 2, sector_size, erase_time, program_rate, crc_rate=8 * 1024 * 1024)
+    session = SimSession(flash)
+    cache = DeltaFlashCache(session.probe.unique_id, "bench")
+    cache.invalidate()
+    image = bytearray(os.urandom(image_size))
+    with bench_memory(result):
+        for run in ("full", "delta", "unchanged"):
+            if run == "delta":
+                sectors = max(1, image_size // sector_size)
+                for n in range(min(changed, sectors)):
+                    image[(n * sectors // max(1, changed)) * sector_size] ^= 0xff
+            updates = []
+            start = time.perf_counter()
+            info = delta_program(session, FlashImage.from_bin(bytes(image)), cache,
+                                 lambda p: updates.append(time.perf_counter()), True, SimFlashLoader)
+            elapsed = time.perf_counter() - start
+            gaps = [(b - a) * 1000 for a, b in zip([start] + updates, updates)]
+            result[run] = {"time_s": elapsed, "kbps": image_size / 1024 / elapsed, "sectors": info["sectors"],
+                           "progress_gap_ms": percentiles(gaps)}
+        sectors = FlashImage.from_bin(bytes(image)).sectors(sector_size)
+        for mode in ("readback", "crc"):
+            info = verify_image(session, sectors, mode=mode)
+            if info["failed"]:
+                raise RuntimeError("simulated flash failed %s verify" % mode)
+            result["verify_" + mode] = {"time_s": info["time"], "kbps": image_size / 1024 / info["time"]}
+    cache.invalidate()
+    if bytes(flash.data[:image_size]) != bytes(image):
+        raise RuntimeError("simulated flash content does not match the image")
+    return result
+
+
+def bench_targets(pack_path: Optional[str] = None, count: int = 5000) -> Dict[str, Any]:
+    """@brief Target catalog load and type-ahead filtering, with a temporary catalog cache.
+
+    With @a pack_path the pack is parsed cold and then read back from the cache; otherwise a
+    synthetic catalog of @a count targets stands in for the builtin list.
+    """
+    result: Dict[str, Any] = {}
+    vendors = ["STMicroelectronics", "NXP", "Nordic Semiconductor", "GigaDevice", "Microchip", "Renesas"]
+    with tempfile.TemporaryDirectory() as directory, bench_memory(result):
+        if pack_path:
+            start = time.perf_counter()
+            rows = PackCatalog(directory).pack_targets(pack_path)
+            result["cold_ms"] = (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            rows = PackCatalog(directory).pack_targets(pack_path)
+        else:
+            rows = [{"name": "%s%04dx%d" % (("stm32f", "lpc", "nrf", "gd32f", "atsam", "r7fa")[i % 6], i, i % 8),
+                     "vendor": vendors[i % 6], "part_number": "PN%05d" % i, "part_families": ["Family %d" % (i % 40)],
+                     "source": "builtin"} for i in range(count)]
+            PackCatalog._write(os.path.join(directory, "bench.json.gz"), {"targets": rows})
+            start = time.perf_counter()
+            rows = PackCatalog._read(os.path.join(directory, "bench.json.gz"))["targets"]
+        result["warm_ms"] = (time.perf_counter() - start) * 1000
+        view = TargetTableView("bench_table", "bench_scroll")
+        start = time.perf_counter()
+        view.index_rows(rows)
+        result["index_ms"] = (time.perf_counter() - start) * 1000
+        keystrokes = []
+        for query in ("s", "st", "stm", "stm3", "stm32", "stm32f", "stm32f0", "", "nrf", "nordic", "pn0", "family 3"):
+            start = time.perf_counter()
+            view.apply_filter(query)
+            keystrokes.append((time.perf_counter() - start) * 1000)
+        result["targets"] = len(rows)
+        result["filter_ms"] = percentiles(keystrokes)
+    return result
+
+
+def bench_probes(count: int = 4, enumerate_time: float = 0.05, interval: float = 0.2, plugs: int = 5) -> Dict[str, Any]:
+    """@brief ProbeWatcher against simulated USB enumeration: list latency and hot-plug detection time."""
+    result: Dict[str, Any] = {}
+    probes = [SimProbe("SIM%04d" % i) for i in range(count)]
+
+    def enumerate_probes():
+        time.sleep(enumerate_time)
+        return list(probes)
+
+    with bench_memory(result):
+        watcher = ProbeWatcher(interval, enumerate_probes)
+        cold = []
+        for _ in range(5):
+            start = time.perf_counter()
+            watcher.probes(max_age=0)
+            cold.append((time.perf_counter() - start) * 1000)
+        cached = []
+        for _ in range(1000):
+            start = time.perf_counter()
+            watcher.probes(max_age=60)
+            cached.append((time.perf_counter() - start) * 1000)
+        watcher.start()
+        detect = []
+        for i in range(plugs):
+            version = watcher.version
+            if i % 2 == 0:
+                probes.append(SimProbe("PLUG%04d" % i))
+            else:
+                probes.pop()
+            start = time.perf_counter()
+            while watcher.version == version and time.perf_counter() - start < interval * 5 + enumerate_time * 5:
+                time.sleep(0.001)
+            detect.append((time.perf_counter() - start) * 1000)
+        watcher.stop()
+    result.update({"list_ms": percentiles(cold), "cached_ms": percentiles(cached), "hotplug_ms": percentiles(detect)})
+    return result
+
+
+BENCH_SUITES = ("rtt", "flash", "targets", "probes")
+
+def _bench_flatten(prefix: str, value, out: Dict[str, float]) -> Dict[str, float]:
+    if isinstance(value, dict):
+        for key, item in value.items():
+            _bench_flatten("%s.%s" % (prefix, key) if prefix else key, item, out)
+    elif isinstance(value, (int, float)):
+        out[prefix] = value
+    return out
+
+def run_benchmarks(args) -> int:
+    """@brief Run the selected suites, print the metrics next to the previous run's and log them.
+
+    Each run is appended as one JSON line to cache/bench/results.jsonl; the comparison uses the last
+    run with the same parameters.
+    """
+    global bench_trace_memory
+    bench_trace_memory = args.bench_trace
+    suites = args.bench or list(BENCH_SUITES)
+    params = {"rtt_rate": args.rtt_rate, "rtt_channels": args.rtt_channels, "duration": args.bench_time,
+              "image_size": args.image_size, "pack": args.pack, "trace": args.bench_trace}
+    results: Dict[str, Any] = {}
+    for suite in suites:
+        print("bench %s ..." % suite, flush=True)
+        if suite == "rtt":
+            results[suite] = bench_rtt(args.bench_time, args.rtt_rate, args.rtt_channels,
+                                       read_config_int("rtt_up_buffer_size", 1024))
+        elif suite == "flash":
+            results[suite] = bench_flash(args.image_size)
+        elif suite == "targets":
+            results[suite] = bench_targets(args.pack)
+        elif suite == "probes":
+            results[suite] = bench_probes()
+        else:
+            print("unknown suite %s, expected one of %s" % (suite, ", ".join(BENCH_SUITES)))
+            return 1
+
+    path = os.path.join(cache_dir("bench"), "results.jsonl")
+    previous = {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                if record.get("params") == params:
+                    previous = _bench_flatten('', record["results"], {})
+    except (OSError, ValueError):
+        pass
+    for key, value in _bench_flatten('', results, {}).items():
+        old = previous.get(key)
+        change = "  (%+.1f%%)" % ((value - old) * 100 / old) if old else ""
+        print("  %-32s %12.3f%s" % (key, value, change))
+    with open(path, 'a', encoding="utf-8") as f:
+        f.write(json.dumps({"time": time.strftime("%Y-%m-%d %H:%M:%S"), "version": __version__,
+                            "python": platform.python_version(), "params": params, "results": results}) + "\n")
+    return 0
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="pyOCD GUI")
+    parser.add_argument("--bench", nargs='*', metavar="SUITE",
+                        help="run benchmarks against a simulated probe and target (%s)" % ", ".join(BENCH_SUITES))
+    parser.add_argument("--bench-time", type=float, default=5.0, help="RTT benchmark duration in seconds")
+    parser.add_argument("--rtt-rate", type=int, default=256 * 1024, help="simulated RTT bytes/s per up channel")
+    parser.add_argument("--rtt-channels", type=int, default=1, help="simulated RTT up channels")
+    parser.add_argument("--image-size", type=int, default=64 * 1024, help="simulated flash image size in bytes")
+    parser.add_argument("--run", nargs='+', metavar="STEP",
+                        help="run steps headless on one session: %s" % "; ".join(BATCH_STEPS.values()))
+    parser.add_argument("--script", metavar="FILE", help="run the steps listed in FILE, one per line")
+    parser.add_argument("--probe", help="probe unique ID (default: the first probe found)")
+    parser.add_argument("--target", help="target name (default: the one last chosen in the GUI)")
+    parser.add_argument("--pack", help="CMSIS pack (default for --run: the one last chosen in the GUI)")
+    parser.add_argument("--profile", help="use a saved configuration profile (probe setup, pack, target, image)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log pyOCD info messages")
+    parser.add_argument("--bench-trace", action="store_true", help="trace Python allocations (slows the benchmarks down)")
+    args = parser.parse_args()
+    if args.profile and not load_profile(args.profile):
+        parser.error("no profile named '%s'" % args.profile)
+    if args.bench is not None:
+        sys.exit(run_benchmarks(args))
+    if args.run or args.script:
+        logging.basicConfig(level=logging.INFO if args.verbose else DEFAULT_LOG_LEVEL)
+        steps = (args.run or []) + (read_batch_script(args.script) if args.script else [])
+        sys.exit(run_batch(steps, args.probe, args.pack or read_config("pack_path") or None,
+                           args.target or read_config("target_name") or None))
     print("当前版本： ", __version__)
-    print_devices()
+    #print_devices()
     #print_pack_targets()
     #print_targets()
     #erase_targets()
     #load_targets()
+    startupTimer = StartupTimer(_startup_t0)
     rttThread = RTTThread()
+    jobExecutor = JobExecutor(workers=read_config_int("job_workers", 2))
+    probeWatcher.interval = read_config_float("probe_scan_interval", 2.0)
+    probeWatcher.start()
     show_ui()
     #open_rtt()
     #progress_print(fun=del_progress)